@@ -5,9 +5,10 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 import util
 
 from abc import ABC, abstractmethod
-from func_timeout import FunctionTimedOut
 
 import interface
+from core.input_handler.deadline import Deadline, DeadlineExceeded
+from core.interaction_handler.storage import get_storage_backend
 from core.interaction_handler.user_requests_db import InteractionDB
 from core.interaction_handler.msg import Message
 
@@ -23,27 +24,26 @@ class CIS(ABC):
         self.params = params
         if params['mode'] == 'live':
             self.params['live_request_handler'] = self.live_request_handler
-            self.msg_db = InteractionDB(host=self.params['interaction_db_host'],
-                                        port=self.params['interaction_db_port'],
-                                        dbname=self.params['interaction_db_name'])
+            self.msg_db = InteractionDB(get_storage_backend(self.params))
         elif params['mode'] == 'exp':
             self.params['experimental_request_handler'] = self.request_handler_func
+            self.params['experimental_batch_request_handler'] = self.batch_request_handler_func
 
         self.interface = interface.get_interface(params)
         self.timeout = self.params['timeout'] if 'timeout' in self.params else -1
 
     def live_request_handler(self, msg):
         try:
-            # load conversation from the database and add the current message to the database
+            # load conversation from the database (one indexed read) and queue the current message for writing
             conv = [msg] + self.msg_db.get_conv_history(user_id=msg.user_id, max_time=10 * 60 * 1000, max_count=10)
             self.msg_db.insert_one(msg)
 
-            # output_msg = func_timeout(self.timeout, self.request_handler_func, args=[conv])
-            output_msg = self.request_handler_func(conv)
+            # the deadline is checked by every stage, which takes a cheaper path instead of stalling when it runs short
+            output_msg = self.request_handler_func(conv, Deadline(self.timeout))
             self.msg_db.insert_one(output_msg)
             return output_msg
 
-        except FunctionTimedOut:
+        except DeadlineExceeded:
             msg_info = dict()
             msg_info['msg_id'] = msg.msg_info['msg_id']
             msg_info['msg_source'] = 'system'
@@ -82,9 +82,26 @@ class CIS(ABC):
     #     return output_msg
 
     @abstractmethod
-    def request_handler_func(self, conv_list):
+    def request_handler_func(self, conv_list, deadline=None):
         pass
 
+    def batch_request_handler_func(self, conv_lists):
+        """
+        Handles many conversations at once. Applications able to share work across conversations should override it.
+        Args:
+            conv_lists(list): A list of conv_list, as given to request_handler_func.
+        Returns:
+            The list of output messages, in the order of conv_lists.
+        """
+        return [self.request_handler_func(conv_list) for conv_list in conv_lists]
+
+    def close(self):
+        """
+        Writes the messages still queued for the interaction database, and closes it.
+        """
+        if hasattr(self, 'msg_db'):
+            self.msg_db.close()
+
     @abstractmethod
     def run(self):
         pass
\ No newline at end of file
@@ -60,4 +60,20 @@ class QuestionAction(Action):
         Returns:
 
         """
-        return params['actions']['question'].get_results(conv_list)
\ No newline at end of file
+        return params['actions']['question'].get_results(conv_list)
+
+class RankedConferenceAction(Action):
+    @staticmethod
+    def run(conv_list, params):
+        """
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            params(dict): A dict containing some parameters. The parameter 'retrieval' is required, which should be the
+            retrieval model object.
+        Returns:
+            The full ranked list of answers, best first, or an error str.
+        """
+        index = params['DA list'][0]['index']
+        return params['actions']['conference'].get_ranked_results(conv_list, index)
@@ -0,0 +1,120 @@
+"""
+A gazetteer-based author recognizer built from the authors of the loaded conferences.
+"""
+
+import re
+import unicodedata
+
+word_pattern = re.compile(r"[^\W\d_]+")
+
+
+def normalize_token(token):
+    """
+    Lowercases a token and strips its accents, so that e.g. 'Jérôme' and 'jerome' are the same token.
+    """
+    token = unicodedata.normalize('NFKD', token)
+    return ''.join(c for c in token if not unicodedata.combining(c)).lower()
+
+
+def name_tokens(name):
+    """
+    Splits a person name into normalized tokens. Hyphens, dots and other punctuation separate tokens.
+    """
+    return [normalize_token(t) for t in word_pattern.findall(name)]
+
+
+def iter_conference_authors(data):
+    """
+    Yields every author name listed in the conference data (see ConferenceRetrieval.get_data()). Sessions list one
+    author list per paper, while workshops and tutorials list the author names directly.
+    """
+    for conference in data.values():
+        for entries in conference.values():
+            for entry in entries:
+                for a in entry.get('authors', []):
+                    if isinstance(a, list):
+                        for name in a:
+                            yield name
+                    else:
+                        yield a
+
+
+class AuthorGazetteer:
+    def __init__(self, names, max_tokens=5):
+        """
+        A dictionary-based person name recognizer. A span of the message is recognized as an author if it is a known
+        name, possibly with its tokens reordered ('Zamani Hamed'), or a first-name initial followed by a known last name
+        ('H. Zamani') that is unique in the gazetteer.
+        Args:
+            names(iterable): The author names to recognize.
+            max_tokens(int): The maximum number of tokens of a recognized name.
+        """
+        self.max_tokens = max_tokens
+        self.full = {}
+        self.bag = {}
+        self.initials = {}
+        for name in names:
+            self.add(name)
+
+    @classmethod
+    def from_conference_data(cls, data, **kwargs):
+        return cls(iter_conference_authors(data), **kwargs)
+
+    def add(self, name):
+        tokens = name_tokens(name)
+        if len(tokens) == 0 or len(tokens) > self.max_tokens:
+            return
+        self.full.setdefault(tuple(tokens), set()).add(name)
+        if len(tokens) > 1:
+            self.bag.setdefault(tuple(sorted(tokens)), set()).add(name)
+            self.initials.setdefault((tokens[0][0], tokens[-1]), set()).add(name)
+
+    def __len__(self):
+        return len(self.full)
+
+    def lookup(self, raw_tokens):
+        """
+        Looks up a span of the message.
+        Args:
+            raw_tokens(list): The tokens of the span, as written by the user.
+        Returns:
+            The set of author names matching the span, or an empty set.
+        """
+        tokens = [normalize_token(t) for t in raw_tokens]
+        key = tuple(tokens)
+        if key in self.full:
+            return self.full[key]
+        if len(tokens) < 2:
+            return set()
+        key = tuple(sorted(tokens))
+        if key in self.bag:
+            return self.bag[key]
+        if len(tokens) == 2 and len(tokens[0]) == 1 and raw_tokens[0].isupper() and raw_tokens[1][0].isupper():
+            candidates = self.initials.get((tokens[0], tokens[1]), set())
+            if len(candidates) == 1:
+                return candidates
+        return set()
+
+    def recognize(self, text):
+        """
+        Finds the known authors mentioned in a text. Longer spans are preferred, and spans do not overlap.
+        Args:
+            text(str): The user message.
+        Returns:
+            A str list of author names as written in the conference data, in order of occurrence.
+        """
+        raw_tokens = word_pattern.findall(text)
+        authors = []
+        i = 0
+        while i < len(raw_tokens):
+            end = i
+            for j in range(min(len(raw_tokens), i + self.max_tokens), i, -1):
+                matches = self.lookup(raw_tokens[i:j])
+                if len(matches) > 0:
+                    for name in sorted(matches):
+                        if name not in authors:
+                            authors.append(name)
+                    end = j - 1
+                    break
+            i = end + 1
+        return authors
@@ -0,0 +1,50 @@
+"""
+Per-request deadlines, checked by the pipeline stages to bound the latency of a turn.
+"""
+
+import math
+import time
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        """
+        A point in time by which the response to a request should be ready.
+        Args:
+            seconds(float): The time budget of the request. None or a non-positive value means no deadline.
+        """
+        self.expires = None if seconds is None or seconds <= 0 else time.monotonic() + seconds
+
+    def remaining(self):
+        """
+        Returns:
+            The remaining budget in seconds (math.inf if there is no deadline, 0 once expired).
+        """
+        if self.expires is None:
+            return math.inf
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, seconds):
+        """
+        Checks if a stage expected to take the given number of seconds fits in the remaining budget.
+        """
+        return self.remaining() >= seconds
+
+    def timeout(self, default):
+        """
+        Returns:
+            The timeout to use for a blocking call: the default, capped by the remaining budget.
+        Raises:
+            DeadlineExceeded: If the deadline has expired.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('The request deadline has expired.')
+        return min(default, remaining)
@@ -1,10 +1,25 @@
+import asyncio
 import json
+import logging
+import os
+import threading
+
+import util
 
 from ..input_handler import actions
 from ..input_handler.query_classification import QueryClassification
+from ..input_handler.turn_context import TurnContext, current_turn
+from ..input_handler.response_cache import ResponseCache
+from ..input_handler.deadline import Deadline
+from ..input_handler.result_cursor import ResultCursorStore
+from ..input_handler.serving import AdmissionController, Overloaded, serve_threaded, serve_prefork
+from ..interaction_handler.dialogue_state import DialogueStateStore, SessionDAList
+from ..interaction_handler.msg import Message
 from ..retriever.conference_retrieval import ConferenceRetrieval
 from ..retriever.paper_retriever import PaperRetrieval
+from ..retriever.profile_job import ProfilePrecomputeJob
 from ..retriever.question_retrieval import QuestionRetrieval
+from concurrent.futures import ThreadPoolExecutor
 from flask import request, Flask, jsonify
 from flask_cors import CORS
 
@@ -25,25 +40,158 @@ class DialogManager:
 
         self.params['needed info'] = []
 
-        self.conv_list = [] #Testing purposes
+        # the event loop of each calling thread is kept across turns, and all of them share one pool of stage threads
+        self.executor = ThreadPoolExecutor(max_workers=params.get('dispatch threads'), thread_name_prefix='dispatch')
+        self.local = threading.local()
+        self.loops = []
+        self.loops_lock = threading.Lock()
+
+        # every user gets a bounded history of dialogue acts; params['DA list'] shows the one of the user being served
+        self.states = DialogueStateStore(max_acts=params.get('max dialogue acts', 20),
+                                         max_sessions=params.get('max sessions', 10000),
+                                         path=params.get('dialogue state path'))
+        self.params['DA list'] = SessionDAList(params.get('max dialogue acts', 20))
+
+        # ranked answers of previous questions, so that acceptance turns only advance a cursor
+        self.cursors = ResultCursorStore(ttl=params.get('result ttl', 600),
+                                         max_items=params.get('result max items', 100000))
+
+        # answers to recent questions, reused for identical or near-duplicate questions. Near-duplicates only share
+        # answers that are computed without the text (3) or from its embedding alone (4-5, 11-12); the other intents
+        # pick a session or entity name by BM25 on the exact terms of the text.
+        self.responses = ResponseCache(ttl=params.get('response ttl', 3600),
+                                       max_entries=params.get('response cache size', 10000),
+                                       threshold=params.get('response similarity', 0.95),
+                                       semantic_intents=params.get('response semantic intents', {3, 4, 5, 11, 12}))
+
+        # the profiles of all conference authors, precomputed in the background within a share of the API rate limit
+        self.profile_job = ProfilePrecomputeJob(self.CR, self.PR, rate=params.get('profile job rate', 0.2),
+                                                interval=params.get('profile job interval', 12 * 3600))
+        # with prefork serving, every worker runs its own job (see post_fork())
+        if params.get('profile job', False) and params.get('serve mode') != 'prefork':
+            self.profile_job.start()
     
-    #Testing purposes
-    def serve(self, port=80):
+    def session(self, conv_list):
+        """
+        Returns a context manager making params['DA list'] show the dialogue acts of the user of conv_list, e.g. for
+        the output selection of a dispatched turn.
+        """
+        return self.states.session(conv_list[0].user_id)
+
+    def close(self):
+        self.profile_job.stop()
+        self.states.close()
+        self.PR.api.close()
+        with self.loops_lock:
+            for loop in self.loops:
+                loop.close()
+            self.loops = []
+        self.executor.shutdown()
+
+    def reload_conference_data(self):
+        """
+        Reloads the conference dataset, and drops everything derived from the previous one.
+        """
+        self.CR.reload_data()
+        self.QC.load_authors()
+        self.responses.clear()
+
+    def serve(self, port=80, mode=None):
+        """
+        Serves the HTTP endpoints.
+        Args:
+            port(int): The port to listen on.
+            mode(str): 'dev' for the single-process Flask development server, 'threaded' for a single process serving
+            params['serve threads'] requests at once, or 'prefork' for gunicorn worker processes sharing the already
+            loaded models. Defaults to params['serve mode'], or 'dev'. In 'prefork' mode every worker keeps its own
+            dialogue states, so multi-turn conversations need sticky routing of users to workers.
+        """
+        mode = mode if mode is not None else self.params.get('serve mode', 'dev')
+        threads = self.params.get('serve threads', 4)
+        max_queue = self.params.get('max queue', 64)
+        self.admission = AdmissionController(workers=threads, max_queue=max_queue,
+                                             max_queue_latency=self.params.get('max queue latency', 2.0))
+        # the server runs a thread for every request being processed or waiting for admission, plus one answering the
+        # requests shed once the queue is full, so that excess requests wait in the admission queue and not unbounded
+        # in the server
+        handlers = threads + max_queue + 1
         self.build_endpoints()
-        self.app.run(host='0.0.0.0', port=port)
+        if mode == 'dev':
+            self.app.run(host='0.0.0.0', port=port)
+        elif mode == 'threaded':
+            serve_threaded(self.app, '0.0.0.0', port, handlers)
+        elif mode == 'prefork':
+            # a job thread does not survive the fork, and could leave the locks it holds acquired in the workers
+            self.profile_job.stop()
+            serve_prefork(self.app, '0.0.0.0', port, self.params.get('serve workers', 2), handlers,
+                          post_fork=self.post_fork)
+        else:
+            raise Exception('The requested serve mode does not exist!')
+
+    def post_fork(self):
+        """
+        Runs in every prefork worker right after it is forked. SQLite connections, the pooled HTTP connections and the
+        torch thread pools of the master process must not be used from a forked worker, so the worker opens its own,
+        and splits the CPU cores with the other workers (params['torch threads'] per worker). Each worker also runs
+        its own profile job, for its own caches, within its share of params['profile job rate']. With a
+        params['semantic scholar cache'], the responses fetched by one worker are cache hits for the others.
+        """
+        import torch
+
+        self.states.reopen()
+        self.PR.api.reopen()
+        workers = self.params.get('serve workers', 2)
+        torch.set_num_threads(self.params.get('torch threads', max(1, (os.cpu_count() or 1) // workers)))
+        if self.params.get('profile job', False):
+            self.profile_job.rate = self.params.get('profile job rate', 0.2) / workers
+            self.profile_job.start()
     
-    #Testing purposes
     def build_endpoints(self):
+        @self.app.errorhandler(Overloaded)
+        def overloaded_handler(ex):
+            return jsonify({'error': str(ex)}), 503, {'Retry-After': '1'}
+
+        @self.app.route('/stats', methods=['GET'])
+        def stats_endpoint():
+            return jsonify({'response cache': self.responses.stats(),
+                            'profile vectors': self.CR.profile_vectors.stats(),
+                            'profile job': self.profile_job.stats()})
+
+        @self.app.route('/encode_batch', methods=['POST'])
+        def encode_batch_endpoint():
+            conversations = []
+            for query in request.get_json()['queries']:
+                msg = Message(user_interface='http',
+                              user_id=str(query.get('user_id', 'http')),
+                              user_info={},
+                              msg_info={'msg_id': -1, 'msg_type': 'text', 'msg_source': 'user'},
+                              text=str(query['text']),
+                              timestamp=util.current_time_in_milliseconds())
+                conversations.append([msg])
+            with self.admission.admit():
+                answers = self.dispatch_batch(conversations, self.params.get('timeout'))
+            return json.dumps(answers, indent=4)
+
         @self.app.route('/encode', methods=['POST', 'GET'])
         def encode_endpoint():
             text = str(request.args.get('text'))
-            self.conv_list.insert(0, text)
-            answer = self.dispatch(self.conv_list)
+            user_id = str(request.args.get('user_id', 'http'))
+            msg = Message(user_interface='http',
+                          user_id=user_id,
+                          user_info={},
+                          msg_info={'msg_id': -1, 'msg_type': 'text', 'msg_source': 'user'},
+                          text=text,
+                          timestamp=util.current_time_in_milliseconds())
+            with self.admission.admit():
+                answer = self.dispatch([msg], Deadline(self.params.get('timeout')))
             results = json.dumps(answer, indent=4)
             return results
     
     def info_needed(self):
         curr_da = self.params['DA list'][0]
+        # acceptance turns take the slots of the act they follow up on
+        if curr_da['intent'] == 'acceptance':
+            return
         entities = curr_da['entity']
         print(curr_da)
         if len(entities) < 1:
@@ -59,6 +207,37 @@ class DialogManager:
     def action_detection(self, conv_list):
         self.params['DA list'].insert(0, self.QC.create_DA(conv_list))
     
+    def ranked_answer(self, key, ranked):
+        """
+        Answers with the best of a ranked list, and keeps the list so that follow-up turns can page through it.
+        """
+        if isinstance(ranked, str) or len(ranked) == 0:
+            return {key: ranked}
+        self.params['DA list'][0]['cursor'] = self.cursors.open(key, ranked)
+        return {key: ranked[0]}
+
+    def cached_conv_logic(self, index, conv_list):
+        """
+        Same as conv_logic(), except that answers are reused for identical or near-duplicate questions (see
+        ResponseCache). Questions answered by asking for a paper title are not cached, and neither are partial answers.
+        """
+        if index in range(7,9) or index in range(13,15):
+            return self.conv_logic(index, conv_list)
+        curr_da = self.params['DA list'][0]
+        text = conv_list[0].text
+        vector = current_turn().embedding(self.QC.model_name, self.QC.model, text)
+        cached = self.responses.get(curr_da, text, vector)
+        if cached is not None:
+            result, ranked = cached
+            if ranked is not None:
+                curr_da['cursor'] = self.cursors.open(*ranked)
+            return result
+        result = self.conv_logic(index, conv_list)
+        if len(current_turn().degraded) == 0:
+            ranked = self.cursors.ranked(curr_da['cursor']) if curr_da['cursor'] is not None else None
+            self.responses.put(curr_da, text, vector, (result, ranked))
+        return result
+
     def conv_logic(self, index, conv_list):
         if index in range(0,2):
             return {'conf author': actions.ConferenceAction.run(conv_list, self.params)}
@@ -67,20 +246,124 @@ class DialogManager:
         if index == 3:
             return {'where author': actions.ConferenceAction.run(conv_list, self.params)}
         if index in range(4,6):
-            return {'conf rec': actions.ConferenceAction.run(conv_list, self.params)}
+            return self.ranked_answer('conf rec', actions.RankedConferenceAction.run(conv_list, self.params))
         if index == 6:
             return {'session papers': actions.ConferenceAction.run(conv_list, self.params)}
         if index in range(7,9):
+            self.prefetch_author()
             return {'title ques': actions.QuestionAction.run(conv_list, self.params)}
         if index in range(9,11):
-            return {'conf paper title rec': actions.ConferenceAction.run(conv_list, self.params)}
+            return self.ranked_answer('conf paper title rec', actions.RankedConferenceAction.run(conv_list, self.params))
         if index in range(11,13):
-            return {'paper qa': actions.RetrievalAction.run(conv_list, self.params)}
+            return self.ranked_answer('paper qa', actions.RetrievalAction.run(conv_list, self.params))
         if index in range(13,15):
+            self.prefetch_author()
             return {'title ques': actions.QuestionAction.run(conv_list, self.params)}
+
+    def prefetch_author(self):
+        """
+        Starts fetching the profile candidates of the author of the current question, while the user is asked for one
+        of their paper titles.
+        """
+        authors = self.params['DA list'][0]['authors']
+        if len(authors) > 0:
+            self.PR.prefetch_author(authors[0])
     
-    def dispatch(self, conv_list):
-        self.action_detection(conv_list)
+    def event_loop(self):
+        """
+        Returns:
+            The event loop of the calling thread, created on its first turn.
+        """
+        loop = getattr(self.local, 'loop', None)
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(self.executor)
+            self.local.loop = loop
+            with self.loops_lock:
+                self.loops.append(loop)
+        return loop
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine to completion on the event loop of the calling thread. Callers that already run in an event
+        loop must await the coroutine instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self.event_loop().run_until_complete(coroutine)
+        coroutine.close()
+        raise Exception('The dispatcher is called from a running event loop, await dispatch_async() instead!')
+
+    def dispatch(self, conv_list, deadline=None):
+        return self.run(self.dispatch_async(conv_list, deadline))
+
+    async def dispatch_async(self, conv_list, deadline=None, turn=None):
+        """
+        Dispatches one user turn. The stages of dialogue act creation that do not depend on each other run
+        concurrently, and the model-bound stages run in worker threads so that the event loop is never blocked.
+        Args:
+            conv_list(list): List of util.msg.Message, most recent first.
+            deadline(Deadline): The deadline of the turn. Stages running short of time take cheaper paths, in which
+            case the result has a 'partial' entry listing them.
+            turn(TurnContext): A context with artifacts computed ahead of time, e.g. by dispatch_batch().
+        """
+        turn = turn if turn is not None else TurnContext(deadline)
+        with self.states.session(conv_list[0].user_id), turn:
+            self.params['DA list'].insert(0, await self.QC.create_DA_async(conv_list))
+            result = await asyncio.to_thread(self.respond, conv_list)
+        logging.info('Turn artifacts: {}'.format(turn.stats()))
+        if len(turn.degraded) > 0:
+            result = {'partial': turn.degraded, **result}
+        return result
+
+    def dispatch_batch(self, conversations, timeout=None):
+        """
+        Dispatches the last turn of many conversations at once. The model-bound stages run once for the whole batch:
+        intent encoding, NER on the messages the gazetteer does not resolve, and query encoding for the questions
+        ranked by similarity with the message (intents 4-5 and 9-10). Their results are then scattered to the turn
+        context of each conversation, which is dispatched as usual. Conversations are told apart by the user_id of
+        their messages.
+        Everything else still runs once per conversation, one conversation after the other: the conference slots,
+        sparse (BM25) ranking, the dense paper search of paper questions (11-12), author profiles, and the Semantic
+        Scholar and Mongo lookups.
+        Args:
+            conversations(list): A list of conv_list, each a list of util.msg.Message, most recent first.
+            timeout(float): The time budget in seconds of each turn, counted from the start of its own dispatch, or
+            None for no deadline.
+        Returns:
+            The list of dispatcher outputs, in the order of conversations.
+        """
+        texts = [conv_list[0].text for conv_list in conversations]
+        turns = [TurnContext() for _ in conversations]
+
+        intent_vectors = self.QC.model.encode(texts, batch_size=self.params.get('batch size', 64))
+        for turn, text, vector in zip(turns, texts, intent_vectors):
+            turn.put('embedding ' + self.QC.model_name, text, vector)
+
+        self.QC.prefetch_authors(texts)
+
+        intents = self.QC.intent_classifier.classify(intent_vectors)
+        # intent 6 ranks sessions by BM25, and 7-8 by author profile, so only 4-5 and 9-10 encode the message
+        dense = [text for text, intent in zip(texts, intents) if intent[0][0] in (4, 5, 9, 10)]
+        if len(dense) > 0:
+            query_vectors = self.CR.model.encode(dense, batch_size=self.params.get('batch size', 64))
+            dense_vectors = dict(zip(dense, query_vectors))
+            for turn, text in zip(turns, texts):
+                if text in dense_vectors:
+                    turn.put('embedding ' + self.CR.model_name, text, dense_vectors[text])
+
+        async def dispatch_all():
+            results = []
+            for conv_list, turn in zip(conversations, turns):
+                # the turns run one after the other, so each one gets its own budget instead of sharing one
+                turn.deadline = Deadline(timeout)
+                results.append(await self.dispatch_async(conv_list, turn=turn))
+            return results
+
+        return self.run(dispatch_all())
+
+    def respond(self, conv_list):
         self.info_needed()
         curr_da = self.params['DA list'][0]
         if curr_da['error str'] is not None:
@@ -91,19 +374,27 @@ class DialogManager:
         if intent == 'question':
             if curr_da['last DA'] is not None:
                 if index in range(7,9):
-                    return {'userprofile': actions.ConferenceAction.run(conv_list, self.params)}
+                    return self.ranked_answer('userprofile', actions.RankedConferenceAction.run(conv_list, self.params))
                 if index in range(13,15):
                     return {'userprofile': actions.RetrievalAction.run(conv_list, self.params)}
-            return self.conv_logic(index, conv_list)
+            return self.cached_conv_logic(index, conv_list)
         if intent == 'reject':
             return {'inquire': actions.QuestionAction.run(conv_list, self.params)}
         if intent == 'acceptance':
+            if len(self.params['DA list']) < 2:
+                return {'inquire': actions.QuestionAction.run(conv_list, self.params)}
             last_index = self.params['DA list'][1]['index']
             for key in curr_da.keys():
                 if key == 'last similarity':
                     curr_da[key] = self.params['DA list'][1][key] + 1
                 else:
                     curr_da[key] = self.params['DA list'][1][key]
+            if curr_da['cursor'] is not None:
+                answer = self.cursors.advance(curr_da['cursor'])
+                if answer is not None:
+                    key, result, position = answer
+                    curr_da['last similarity'] = position
+                    return {key: result}
             return self.conv_logic(last_index, conv_list)
 
 if __name__ == "__main__": #TESTING PURPOSES
@@ -0,0 +1,77 @@
+"""
+An in-memory intent classifier matching user messages against intent templates.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+import numpy as np
+
+
+class IntentClassifier:
+    def __init__(self, model, model_name, templates, cache_dir=None):
+        """
+        Scores a message against every intent with a dot product between its normalized embedding and a normalized
+        matrix of template embeddings. An intent may have several templates, in which case its score is the maximum
+        over its templates. The template matrix is cached on disk under a hash of the templates and the model name, so
+        it is rebuilt whenever either changes.
+        Args:
+            model(SentenceTransformer): The sentence encoder.
+            model_name(str): The name of the encoder, used in the cache key.
+            templates(list): One entry per intent, either a str or a list of str templates.
+            cache_dir(str): The directory the template matrix is cached in. Nothing is cached if None.
+        """
+        self.model = model
+        self.templates = [[t] if isinstance(t, str) else list(t) for t in templates]
+        self.offsets = np.cumsum([0] + [len(t) for t in self.templates[:-1]])
+        self.key = hashlib.sha1(json.dumps({'model': model_name, 'templates': self.templates}).encode('utf8')).hexdigest()
+
+        path = None if cache_dir is None else '{}/intent_matrix_{}.pkl'.format(cache_dir, self.key[:16])
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.matrix = pickle.load(f)
+        else:
+            logging.info('Encoding intent templates...')
+            self.matrix = self.encode([t for lst in self.templates for t in lst])
+            if path is not None:
+                with open(path, 'wb') as f:
+                    pickle.dump(self.matrix, f, protocol=4)
+
+    def encode(self, texts):
+        vectors = np.asarray(self.model.encode(texts), dtype=np.float32)
+        return self.normalize(vectors)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def scores(self, vectors):
+        """
+        Args:
+            vectors(np.ndarray): Message embeddings, one per row.
+        Returns:
+            A (number of messages) x (number of intents) matrix of cosine similarities.
+        """
+        similarities = self.normalize(vectors) @ self.matrix.T
+        return np.maximum.reduceat(similarities, self.offsets, axis=1)
+
+    def classify(self, vectors, k=1):
+        """
+        Args:
+            vectors(np.ndarray): Message embeddings, one per row.
+            k(int): The number of intents returned per message.
+        Returns:
+            For each message, a list of the k best (intent index, similarity) tuples.
+        """
+        scores = self.scores(vectors)
+        results = []
+        for row in scores:
+            top = np.argsort(-row)[:k]
+            results.append([(int(i), float(row[i])) for i in top])
+        return results
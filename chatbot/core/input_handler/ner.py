@@ -0,0 +1,163 @@
+"""
+Named entity recognition backends used to find person names in user messages.
+"""
+
+import logging
+import queue
+import threading
+
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+
+class NERBackend(ABC):
+    @abstractmethod
+    def tag_batch(self, texts):
+        """
+        Finds the person names in a batch of texts.
+        Args:
+            texts(list): A str list.
+        Returns:
+            A list with, for each text, the str list of person names it contains.
+        """
+        pass
+
+
+class FlairNER(NERBackend):
+    models = {'large': 'flair/ner-english-large',
+              'fast': 'flair/ner-english-fast'}
+
+    def __init__(self, model='large', batch_size=32):
+        from flair.data import Sentence
+        from flair.models import SequenceTagger
+
+        self.sentence = Sentence
+        self.tagger = SequenceTagger.load(self.models.get(model, model))
+        self.batch_size = batch_size
+
+    def tag_batch(self, texts):
+        sentences = [self.sentence(text) for text in texts]
+        self.tagger.predict(sentences, mini_batch_size=self.batch_size)
+        results = []
+        for sentence in sentences:
+            results.append([entity.text for entity in sentence.get_spans('ner')
+                            if entity.get_label('ner').value == 'PER'])
+        return results
+
+
+class SpacyNER(NERBackend):
+    def __init__(self, model='en_core_web_sm', batch_size=32):
+        import spacy
+
+        self.nlp = spacy.load(model, disable=['parser', 'lemmatizer'])
+        self.batch_size = batch_size
+
+    def tag_batch(self, texts):
+        return [[entity.text for entity in doc.ents if entity.label_ == 'PERSON']
+                for doc in self.nlp.pipe(texts, batch_size=self.batch_size)]
+
+
+def get_ner_backend(params):
+    """
+    Creates the NER backend selected by params['ner model']: 'large' (default) or 'fast' flair models, or 'spacy' for a
+    lightweight CPU model.
+    """
+    model = params.get('ner model', 'large')
+    batch_size = params.get('ner batch size', 32)
+    if model in FlairNER.models:
+        return FlairNER(model, batch_size)
+    elif model == 'spacy':
+        return SpacyNER(params.get('spacy model', 'en_core_web_sm'), batch_size)
+    else:
+        raise Exception('The requested NER model does not exist!')
+
+
+class NERBatcher:
+    def __init__(self, backend, batch_size=32, max_wait=0.005, prefetch_batch_size=512, max_prefetched=100000):
+        """
+        Micro-batches concurrent NER requests into a single backend call. A request waits at most max_wait seconds
+        for other requests to join its batch.
+        Args:
+            backend(NERBackend): The NER backend.
+            batch_size(int): The maximum number of texts tagged in one backend call.
+            max_wait(float): The maximum time in seconds a request waits for a batch to fill up. With 0, every request
+            is tagged on its own in the calling thread.
+            prefetch_batch_size(int): The number of texts tagged in one backend call by prefetch().
+            max_prefetched(int): The maximum number of distinct prefetched texts kept; the oldest are evicted first.
+        """
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.prefetch_batch_size = prefetch_batch_size
+        self.requests = queue.Queue()
+        self.max_prefetched = max_prefetched
+        self.prefetched = OrderedDict()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def tag(self, text):
+        """
+        Finds the person names in a text.
+        Args:
+            text(str): The text.
+        Returns:
+            A str list of person names.
+        """
+        with self.lock:
+            if text in self.prefetched:
+                entry = self.prefetched[text]
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.prefetched[text]
+                return entry[0]
+        if self.max_wait <= 0:
+            return self.backend.tag_batch([text])[0]
+        self.start()
+        future = Future()
+        self.requests.put((text, future))
+        return future.result()
+
+    def prefetch(self, texts):
+        """
+        Tags many texts in large batches ahead of time (e.g. a whole experimental input file). The results are served
+        by tag() as many times as each text occurs in texts.
+        Args:
+            texts(list): A str list.
+        """
+        counts = Counter(texts)
+        texts = list(counts)
+        for i in range(0, len(texts), self.prefetch_batch_size):
+            batch = texts[i:i + self.prefetch_batch_size]
+            results = self.backend.tag_batch(batch)
+            with self.lock:
+                for text, result in zip(batch, results):
+                    if text in self.prefetched:
+                        self.prefetched[text][1] += counts[text]
+                    else:
+                        self.prefetched[text] = [result, counts[text]]
+                while len(self.prefetched) > self.max_prefetched:
+                    self.prefetched.popitem(last=False)
+
+    def start(self):
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='ner-batcher', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.requests.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                results = self.backend.tag_batch([text for text, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as ex:
+                logging.exception('NER batch failed')
+                for _, future in batch:
+                    future.set_exception(ex)
@@ -1,14 +1,15 @@
-import pickle
-import faiss
-import os
+import asyncio
 import re
 import json
 
 from sentence_transformers import SentenceTransformer
-from flair.data import Sentence
-from flair.models import SequenceTagger
 from ..interaction_handler.msg import Message
-from ..retriever.dense_retriever import DenseRetriever
+from ..interaction_handler.dialogue_act import DialogueAct
+from ..input_handler.intent_classifier import IntentClassifier
+from ..input_handler.slot_matcher import SlotMatcher
+from ..input_handler.author_gazetteer import AuthorGazetteer
+from ..input_handler.ner import get_ner_backend, NERBatcher
+from ..input_handler.turn_context import current_turn
 
 class QueryClassification:
 	"""
@@ -52,16 +53,73 @@ class QueryClassification:
 		self.conference_list = ['SIGIR']
 		self.conference_years = {'2021': ['2021', '21']}
 
-		self.model = SentenceTransformer('multi-qa-mpnet-base-dot-v1')
-		self.tagger = SequenceTagger.load("flair/ner-english-large")
+		self.slot_matcher = self.build_slot_matcher()
 
-		self.dense_index = DenseRetriever(self.model)
-		if os.path.exists('{}/ques_index.pkl'.format(params['index path'])):
-			self.dense_index.load_index('{}/ques_index.pkl'.format(params['index path']))
-		else:
-			self.dense_index.create_index_from_documents(self.ques_list)
-			self.dense_index.save_index(index_path='{}/ques_index.pkl'.format(params['index path']), vectors_path='{}/ques_vectors.pkl'.format(params['index path']))
+		#Known authors of the loaded conferences, recognized before falling back to NER
+		self.load_authors()
+
+		self.model_name = 'multi-qa-mpnet-base-dot-v1'
+		self.model = SentenceTransformer(self.model_name)
+		self.ner = NERBatcher(get_ner_backend(params),
+							  batch_size=params.get('ner batch size', 32),
+							  max_wait=params.get('ner max wait', 0.005),
+							  max_prefetched=params.get('ner prefetch size', 100000))
+		self.params['ner prefetch'] = self.prefetch_authors
+
+		#Each entry of ques_list may also be a list of templates for the same intent
+		self.intent_classifier = IntentClassifier(self.model, self.model_name, self.ques_list, params['index path'])
 	
+	def load_authors(self):
+		"""
+		Builds the author gazetteer from the conference dataset.
+		"""
+		with open(self.params['conf dataset'], 'r') as f:
+			self.gazetteer = AuthorGazetteer.from_conference_data(json.load(f))
+
+	def build_slot_matcher(self):
+		"""
+		Builds a single multi-pattern matcher over every conference name, year alias, entity keyword, and
+		reject/acceptance phrase, so that all slots are found in one pass over the user message.
+
+		Returns:
+			A SlotMatcher.
+		"""
+		matcher = SlotMatcher()
+		for conference in self.conference_list:
+			matcher.add(conference, ('conference', conference))
+		for year, lst in self.conference_years.items():
+			for word in lst:
+				matcher.add(word, ('year', year))
+		for group, entity in enumerate(self.entities):
+			for rank, word in enumerate(entity):
+				matcher.add(word, ('entity', (group, rank)))
+		for intent, lst in self.other_intents.items():
+			for pattern in lst:
+				matcher.add(pattern, (intent, pattern))
+		matcher.build()
+		return matcher
+
+	def find_slots(self, q):
+		"""
+		Finds every slot mentioned in a given str. The result is memoized in the current turn context, since the
+		same message is inspected by several methods while creating a DialogueAct.
+
+		Args:
+			q(str): Input string to search on.
+
+		Returns:
+			A dict from slot type ('conference', 'year', 'entity', 'reject', 'acceptance') to the list of matched
+			values, in order of occurrence.
+		"""
+		return current_turn().get('slots', q, lambda: self.match_slots(q))
+
+	def match_slots(self, q):
+		slots = {'conference': [], 'year': [], 'entity': [], 'reject': [], 'acceptance': []}
+		for start, end, (slot, value) in self.slot_matcher.search(q):
+			if value not in slots[slot]:
+				slots[slot].append(value)
+		return slots
+
 	def find_word(self, q, pattern):
 		"""
 		Checks if a given str contains specified pattern.
@@ -87,9 +145,8 @@ class QueryClassification:
 		Returns:
 			intent if find_word() is not None, else None.
 		"""
-		for pattern in self.other_intents[intent]:
-			if self.find_word(conv_list[0].text, pattern) is not None:
-				return intent
+		if len(self.find_slots(conv_list[0].text)[intent]) > 0:
+			return intent
 		return None
 	
 	
@@ -111,9 +168,9 @@ class QueryClassification:
 			if self.check_other_intents(conv_list, 'acceptance') is not None:
 				return {'intent': 'acceptance', 'intent index': -1}
 		
-		dense_results = self.dense_index.search([conv_list[0].text])[0]
-		dense_results = [i[0] for i in dense_results]
-		return {'intent': 'question', 'intent index': dense_results[0]}
+		vector = current_turn().embedding(self.model_name, self.model, conv_list[0].text)
+		intent_index, similarity = self.intent_classifier.classify(vector)[0][0]
+		return {'intent': 'question', 'intent index': intent_index}
 
 	def main_conference(self, conv_list):
 		"""
@@ -128,15 +185,15 @@ class QueryClassification:
 		"""
 		result = {'conference': None,
 				  'year': None}
+		slots = self.find_slots(conv_list[0].text)
 		for conference in self.conference_list:
-			if self.find_word(conv_list[0].text, conference) is not None:
+			if conference in slots['conference']:
 				result['conference'] = conference
 		if result['conference'] is not None:
-			for year, lst in self.conference_years.items():
-				for word in lst:
-					if self.find_word(conv_list[0].text, word) is not None:
-						result['year'] = year
-						return result
+			for year in self.conference_years:
+				if year in slots['year']:
+					result['year'] = year
+					return result
 		if len(self.params['DA list']) > 0 and result['conference'] is None and self.params['DA list'][0]['main conference']['conference'] is not None:
 			result['conference'] = self.params['DA list'][0]['main conference']['conference']
 		
@@ -156,18 +213,20 @@ class QueryClassification:
 			A str of the mentioned entity, else '' if user did not mention an entity.
 		"""
 		result = []
-		for entity in self.entities:
-			for word in entity:
-				if self.find_word(conv_list[0].text, word) is not None:
+		matched = self.find_slots(conv_list[0].text)['entity']
+		for group, entity in enumerate(self.entities):
+			for rank, word in enumerate(entity):
+				if (group, rank) in matched:
 					result.append(word)
 					break
-		if len(result) == 0 and len(self.params['DA list'][0]) > 0 and len(self.params['DA list'][0]['entity']) > 0:
+		if len(result) == 0 and len(self.params['DA list']) > 0 and len(self.params['DA list'][0]['entity']) > 0:
 			result = self.params['DA list'][0]['entity']
 		return result
 	
 	def get_authors(self, conv_list):
 		"""
-		Checks if user referred to an author(s).
+		Checks if user referred to an author(s). Authors of the loaded conferences are looked up in the gazetteer, and the
+		NER tagger is only used when none of them is mentioned and the turn deadline has not expired.
 
 		Args:
 			conv_list(list): List of interaction_handler.msg.Message, each corresponding to a conversational message from / to the
@@ -176,14 +235,37 @@ class QueryClassification:
 		Returns:
 			A str list containing authors that the user mentioned, if any.
 		"""
-		authors = []
-		sentence = Sentence(conv_list[0].text)
-		self.tagger.predict(sentence)
-		for entity in sentence.get_spans('ner'):
-			if entity.get_label("ner").value == "PER":
-				authors.append(entity.text)
-		return authors
+		authors = self.gazetteer.recognize(conv_list[0].text)
+		if len(authors) > 0:
+			return authors
+		if current_turn().deadline.expired():
+			current_turn().degrade('ner')
+			return authors
+		return current_turn().get('ner', conv_list[0].text, lambda: self.ner.tag(conv_list[0].text))
 	
+	def prefetch_authors(self, texts):
+		"""
+		Runs NER ahead of time, in large batches, on the messages in which the gazetteer finds no author.
+
+		Args:
+			texts(list): A str list of user messages that get_authors() will be called on.
+		"""
+		self.ner.prefetch([text for text in texts if len(self.gazetteer.recognize(text)) == 0])
+
+	def is_follow_up(self):
+		"""
+		Checks if the user message answers the paper title question asked for the previous DialogueAct.
+		"""
+		return len(self.params['DA list']) > 0 and self.params['DA list'][0]['flag'] and (self.params['DA list'][0]['index'] in range (7,9) or self.params['DA list'][0]['index'] in range (13,15))
+
+	def dialogue_act(self, intent_dict, conference, entity, authors, last_DA=None, flag=True):
+		last_similarity = 0
+		#The new act is not inserted yet, so the previous act is the first one
+		if intent_dict['intent'] == 'acceptance' and len(self.params['DA list']) > 0:
+			last_similarity = self.params['DA list'][0]['last similarity'] + 1
+		return DialogueAct(intent_dict['intent'], intent_dict['intent index'], conference, entity, authors, last_similarity,
+						   last_DA=last_DA, flag=flag)
+
 	def create_DA(self, conv_list):
 		"""
 		Creates a DialogueAct based on user query to contain all needed information for dispatchment. 
@@ -195,34 +277,32 @@ class QueryClassification:
 		Returns:
 			A DialogueAct.
 		"""
-		last_DA = None
-		last_similarity = 0
-		intent_dict = None
-		conference = None
-		entity = None
-		authors = None
-		flag = True
-		if len(self.params['DA list']) > 0 and self.params['DA list'][0]['flag'] and (self.params['DA list'][0]['index'] in range (7,9) or self.params['DA list'][0]['index'] in range (13,15)):
+		if self.is_follow_up():
 			last_DA = self.params['DA list'][0]
-			intent_dict = {'intent': 'question', 'intent index': self.params['DA list'][0]['index']}
-			conference = self.params['DA list'][0]['main conference']
-			entity = self.params['DA list'][0]['entity']
-			authors = self.params['DA list'][0]['authors']
-			flag = False
-		else:
-			intent_dict = self.chack_main_intent(conv_list)
-			if intent_dict['intent'] == 'acceptance':
-				last_similarity = self.params['DA list'][1]['last similarity'] + 1
-
-			conference = self.main_conference(conv_list)
-			entity = self.entity_keywords(conv_list)
-			authors = self.get_authors(conv_list)
-		return {'intent': intent_dict['intent'],
-				'index': intent_dict['intent index'],
-				'main conference': conference,
-				'entity': entity,
-				'authors': authors,
-				'last similarity': last_similarity,
-				'error str': None,
-				'last DA': last_DA,
-				'flag': flag}
\ No newline at end of file
+			intent_dict = {'intent': 'question', 'intent index': last_DA['index']}
+			return self.dialogue_act(intent_dict, last_DA['main conference'], last_DA['entity'], last_DA['authors'], last_DA, False)
+		intent_dict = self.chack_main_intent(conv_list)
+		conference = self.main_conference(conv_list)
+		entity = self.entity_keywords(conv_list)
+		authors = self.get_authors(conv_list)
+		return self.dialogue_act(intent_dict, conference, entity, authors)
+
+	async def create_DA_async(self, conv_list):
+		"""
+		Same as create_DA(), except that intent detection and author recognition, the two model-bound stages, run
+		concurrently in worker threads. The conference and entity slots only need the (memoized) slot matches.
+
+		Args:
+			conv_list(list): List of interaction_handler.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+
+		Returns:
+			A DialogueAct.
+		"""
+		if self.is_follow_up():
+			return self.create_DA(conv_list)
+		intent_dict, authors = await asyncio.gather(asyncio.to_thread(self.chack_main_intent, conv_list),
+													asyncio.to_thread(self.get_authors, conv_list))
+		conference = self.main_conference(conv_list)
+		entity = self.entity_keywords(conv_list)
+		return self.dialogue_act(intent_dict, conference, entity, authors)
@@ -0,0 +1,113 @@
+"""
+A response cache for dialogue act answers, with exact and near-duplicate (semantic) lookups.
+"""
+
+import re
+import threading
+import time
+
+import numpy as np
+
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    text = re.sub('[^a-z0-9 ]+', ' ', text.lower())
+    return re.sub(' +', ' ', text).strip()
+
+
+class ResponseCache:
+    def __init__(self, ttl=3600, max_entries=10000, threshold=0.95, semantic_intents=()):
+        """
+        Caches the answers to questions. An answer is reused for a question with the same dialogue act (intent,
+        conference, year, entities and authors) and either the same normalized text (exact hit), or, for the intents
+        in semantic_intents, a text whose embedding has a cosine similarity of at least threshold (semantic hit).
+        Args:
+            ttl(float): The lifetime of an answer in seconds.
+            max_entries(int): The maximum number of answers kept. The least recently used answers are evicted first.
+            threshold(float): The minimum cosine similarity of a semantic hit.
+            semantic_intents(set): The intents (dialogue act indices) whose answer does not depend on the exact terms
+            of the text, so that it can be reused for near-duplicate texts.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.semantic_intents = set(semantic_intents)
+        self.entries = OrderedDict()  # (DA key, normalized text) -> (created, vector, answer)
+        self.buckets = {}  # DA key -> set of normalized texts
+        self.counts = {'exact': 0, 'semantic': 0, 'miss': 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def da_key(da):
+        conference = da['main conference'] or {}
+        return (da['index'], conference.get('conference'), conference.get('year'),
+                tuple(sorted(da['entity'])), tuple(sorted(da['authors'])))
+
+    def get(self, da, text, vector):
+        """
+        Returns:
+            The cached answer, or None.
+        """
+        da_key = self.da_key(da)
+        key = (da_key, normalize_query(text))
+        with self.lock:
+            # expired answers are dropped when met, the others eventually by the LRU eviction
+            now = time.time()
+            for t in list(self.buckets.get(da_key, ())):
+                if now - self.entries[(da_key, t)][0] > self.ttl:
+                    self.remove((da_key, t))
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counts['exact'] += 1
+                return self.entries[key][2]
+            texts = list(self.buckets.get(da_key, ())) if da['index'] in self.semantic_intents else []
+            if len(texts) > 0:
+                vector = self.normalize(vector)
+                similarities = np.array([self.entries[(da_key, t)][1] for t in texts]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.entries.move_to_end((da_key, texts[best]))
+                    self.counts['semantic'] += 1
+                    return self.entries[(da_key, texts[best])][2]
+            self.counts['miss'] += 1
+            return None
+
+    def put(self, da, text, vector, answer):
+        da_key = self.da_key(da)
+        key = (da_key, normalize_query(text))
+        with self.lock:
+            self.entries[key] = (time.time(), self.normalize(vector), answer)
+            self.entries.move_to_end(key)
+            self.buckets.setdefault(da_key, set()).add(key[1])
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        del self.entries[key]
+        self.buckets[key[0]].discard(key[1])
+        if len(self.buckets[key[0]]) == 0:
+            del self.buckets[key[0]]
+
+    def clear(self):
+        """
+        Drops every answer, e.g. when the conference data is reloaded.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.buckets.clear()
+
+    def stats(self):
+        """
+        Returns:
+            The number of exact hits, semantic hits and misses, the hit rate, and the number of cached answers.
+        """
+        with self.lock:
+            lookups = sum(self.counts.values())
+            hits = self.counts['exact'] + self.counts['semantic']
+            return {**self.counts, 'hit rate': hits / lookups if lookups > 0 else 0.0, 'size': len(self.entries)}
+
+    @staticmethod
+    def normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
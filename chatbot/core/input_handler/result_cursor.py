@@ -0,0 +1,97 @@
+"""
+Cursors over the ranked answers of previous questions, used to serve follow-up ("give me more") turns.
+"""
+
+import itertools
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class RankedResults:
+    def __init__(self, key, ranked):
+        """
+        The full ranked list of answers to one question, with a cursor on the answer returned last.
+        Args:
+            key(str): The dispatcher output key of the answers (e.g. 'conf rec').
+            ranked(list): The answers, best first.
+        """
+        self.key = key
+        self.ranked = ranked
+        self.position = 0
+        self.created = time.time()
+
+    def advance(self):
+        """
+        Returns:
+            The next answer, or None if the list is exhausted.
+        """
+        if self.position + 1 >= len(self.ranked):
+            return None
+        self.position += 1
+        return self.ranked[self.position]
+
+
+class ResultCursorStore:
+    def __init__(self, ttl=600, max_items=100000):
+        """
+        Keeps the ranked answers of recent questions. Lists expire after ttl seconds, and the oldest lists are dropped
+        whenever the total number of stored answers exceeds max_items.
+        Args:
+            ttl(float): The lifetime of a ranked list in seconds.
+            max_items(int): The maximum number of answers kept over all lists.
+        """
+        self.ttl = ttl
+        self.max_items = max_items
+        self.results = OrderedDict()
+        self.num_items = 0
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def open(self, key, ranked):
+        """
+        Stores a ranked list of answers.
+        Returns:
+            The cursor id of the list, to be kept in the dialogue state.
+        """
+        with self.lock:
+            cursor_id = next(self.ids)
+            self.results[cursor_id] = RankedResults(key, ranked)
+            self.num_items += len(ranked)
+            self.evict()
+            return cursor_id
+
+    def advance(self, cursor_id):
+        """
+        Moves a cursor to the next answer.
+        Returns:
+            A (key, answer, position) tuple, or None if the list expired, was evicted, or is exhausted.
+        """
+        with self.lock:
+            self.evict()
+            results = self.results.get(cursor_id)
+            if results is None:
+                return None
+            answer = results.advance()
+            if answer is None:
+                return None
+            return results.key, answer, results.position
+
+    def ranked(self, cursor_id):
+        """
+        Returns:
+            A (key, ranked answers) tuple, or None if the list expired or was evicted.
+        """
+        with self.lock:
+            results = self.results.get(cursor_id)
+            return None if results is None else (results.key, results.ranked)
+
+    def evict(self):
+        now = time.time()
+        while len(self.results) > 0:
+            cursor_id, results = next(iter(self.results.items()))
+            if self.num_items <= self.max_items and now - results.created <= self.ttl:
+                break
+            del self.results[cursor_id]
+            self.num_items -= len(results.ranked)
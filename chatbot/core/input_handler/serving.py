@@ -0,0 +1,92 @@
+"""
+Production serving of the dialog manager HTTP endpoints: admission control and multi-worker servers.
+"""
+
+import logging
+import threading
+
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionController:
+    def __init__(self, workers=4, max_queue=64, max_queue_latency=2.0):
+        """
+        Bounds the number of requests processed at once. Requests beyond that wait in a bounded queue; a request is
+        shed when the queue is full, or when it waited for more than max_queue_latency seconds.
+        Args:
+            workers(int): The number of requests processed concurrently.
+            max_queue(int): The maximum number of waiting requests.
+            max_queue_latency(float): The maximum time in seconds a request may wait before being processed.
+        """
+        self.slots = threading.BoundedSemaphore(workers)
+        self.max_queue = max_queue
+        self.max_queue_latency = max_queue_latency
+        self.waiting = 0
+        self.shed = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def admit(self):
+        """
+        Holds a processing slot for the duration of the block.
+        Raises:
+            Overloaded: If the request is shed.
+        """
+        with self.lock:
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                raise Overloaded('The request queue is full.')
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.max_queue_latency)
+        with self.lock:
+            self.waiting -= 1
+            if not acquired:
+                self.shed += 1
+        if not acquired:
+            raise Overloaded('The request waited too long in the queue.')
+        try:
+            yield
+        finally:
+            self.slots.release()
+
+
+def serve_threaded(app, host, port, threads):
+    """
+    Serves the app from a single process with the waitress WSGI server and a pool of threads threads. Admission
+    control bounds how many of them run the pipeline at once, so threads should cover the admission queue.
+    """
+    from waitress import serve
+
+    logging.info('Serving with {} threads'.format(threads))
+    serve(app, host=host, port=port, threads=threads)
+
+
+def serve_prefork(app, host, port, workers, threads, post_fork=None):
+    """
+    Serves the app with gunicorn worker processes forked from the current process. Models loaded before calling this
+    are shared copy-on-write by the workers instead of being loaded once per worker.
+    Args:
+        threads(int): The number of request threads per worker, which should cover the admission queue.
+        post_fork(function): Called without arguments in every worker right after it is forked, to reopen what must
+        not be shared with the master process (SQLite connections, connection pools, thread pools).
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class PreforkApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', '{}:{}'.format(host, port))
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('preload_app', True)
+            if post_fork is not None:
+                self.cfg.set('post_fork', lambda server, worker: post_fork())
+
+        def load(self):
+            return app
+
+    logging.info('Serving with {} worker processes of {} threads'.format(workers, threads))
+    PreforkApplication().run()
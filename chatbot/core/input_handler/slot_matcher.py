@@ -0,0 +1,83 @@
+"""
+A single-pass, case-insensitive multi-pattern matcher (Aho-Corasick) used to detect slots in user messages.
+"""
+
+from collections import deque
+
+
+class SlotMatcher:
+    def __init__(self):
+        """
+        An Aho-Corasick automaton over lowercased phrases. Every phrase carries a payload which is reported whenever
+        the phrase occurs in the searched text. Searching costs a single pass over the text, independently of the
+        number of phrases added.
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.phrases = [[]]
+        self.output = [[]]
+        self.built = False
+
+    def add(self, phrase, payload):
+        """
+        Adds a phrase to the automaton.
+        Args:
+            phrase(str): The phrase to look for. Matching is case-insensitive.
+            payload: Any object reported with each occurrence of the phrase.
+        """
+        phrase = phrase.lower()
+        if len(phrase) == 0:
+            return
+        state = 0
+        for char in phrase:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.phrases.append([])
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.phrases[state].append((len(phrase), payload))
+        self.built = False
+
+    def build(self):
+        """
+        Computes the failure links. Called lazily by search() after phrases have been added. Links and outputs are
+        recomputed from the added phrases, so building again after more add() calls is safe.
+        """
+        self.fail = [0] * len(self.goto)
+        self.output = [list(phrases) for phrases in self.phrases]
+        queue = deque()
+        for state in self.goto[0].values():
+            self.fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        self.built = True
+
+    def search(self, text):
+        """
+        Finds every occurrence of every phrase in text, including overlapping ones.
+        Args:
+            text(str): The text to search on.
+        Returns:
+            A list of (start, end, payload) tuples ordered by end position.
+        """
+        if not self.built:
+            self.build()
+        matches = []
+        state = 0
+        for position, char in enumerate(text.lower()):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, payload in self.output[state]:
+                matches.append((position - length + 1, position + 1, payload))
+        return matches
@@ -0,0 +1,96 @@
+"""
+The per-turn computation context, shared by every stage that processes the same user message.
+"""
+
+import contextvars
+import threading
+
+from ..input_handler.deadline import Deadline
+
+_current_turn = contextvars.ContextVar('current_turn', default=None)
+
+
+class TurnContext:
+    def __init__(self, deadline=None):
+        """
+        Memoizes artifacts derived from the user message during one turn (embeddings per model, tokens, n-grams, NER
+        spans, ...), so that each of them is computed at most once however many stages need it. The dialog manager
+        activates a context for each turn with a `with` block; actions and retrievers reach it through current_turn().
+        The context also carries the deadline of the turn, and records the stages that degraded to a cheaper path to
+        meet it.
+        Args:
+            deadline(Deadline): The deadline of the turn. None means no deadline.
+        """
+        self.deadline = deadline if deadline is not None else Deadline()
+        self.degraded = []
+        self.artifacts = {}
+        self.computed = {}
+        self.reused = {}
+        self.lock = threading.Lock()
+        self.var_tokens = []
+
+    def get(self, kind, key, compute):
+        """
+        Returns a memoized artifact, computing it if needed.
+        Args:
+            kind(str): The kind of artifact, e.g. 'tokens' or 'embedding multi-qa-mpnet-base-dot-v1'.
+            key: What the artifact is derived from, usually the message text.
+            compute(callable): Computes the artifact when it is not memoized yet.
+        Returns:
+            The artifact.
+        """
+        with self.lock:
+            if (kind, key) in self.artifacts:
+                self.reused[kind] = self.reused.get(kind, 0) + 1
+                return self.artifacts[(kind, key)]
+        value = compute()
+        with self.lock:
+            self.artifacts[(kind, key)] = value
+            self.computed[kind] = self.computed.get(kind, 0) + 1
+        return value
+
+    def put(self, kind, key, value):
+        """
+        Memoizes an artifact computed elsewhere, e.g. in a batch with other turns.
+        """
+        with self.lock:
+            self.artifacts[(kind, key)] = value
+
+    def embedding(self, model_name, model, text):
+        """
+        Returns the (unnormalized) embedding of text by the given model.
+        """
+        return self.get('embedding ' + model_name, text, lambda: model.encode([text])[0])
+
+    def degrade(self, stage):
+        """
+        Records that a stage took a cheaper path because of the deadline, which makes the answer partial.
+        """
+        with self.lock:
+            if stage not in self.degraded:
+                self.degraded.append(stage)
+
+    def stats(self):
+        """
+        Returns:
+            A dict with, for each kind of artifact, how many times it was computed and how many times it was reused.
+        """
+        with self.lock:
+            return {'computed': dict(self.computed), 'reused': dict(self.reused)}
+
+    def __enter__(self):
+        self.var_tokens.append(_current_turn.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_turn.reset(self.var_tokens.pop())
+
+
+def current_turn():
+    """
+    Returns:
+        The TurnContext of the turn being processed. Outside of a turn, a fresh context is returned, so nothing is
+        reused.
+    """
+    turn = _current_turn.get()
+    return turn if turn is not None else TurnContext()
@@ -0,0 +1,89 @@
+"""
+The dialogue act produced for each user message by query classification, and kept in the dialogue state.
+"""
+
+from collections.abc import MutableMapping
+
+from ..interaction_handler import serialization
+
+
+class DialogueAct(MutableMapping):
+    # the keys of the mapping, each stored in the slot with the same name and underscores for spaces
+    fields = ('intent', 'index', 'main conference', 'entity', 'authors', 'last similarity', 'error str', 'last DA',
+             'flag', 'cursor')
+    __slots__ = tuple(key.replace(' ', '_') for key in fields)
+
+    def __init__(self, intent, index, main_conference, entity, authors, last_similarity=0, error_str=None,
+                 last_DA=None, flag=True, cursor=None):
+        """
+        A fixed-layout record supporting the dict protocol with the keys used throughout the dialog manager
+        (da['main conference'], da['last similarity'], ...).
+        Args:
+            intent(str): The intent of the message, e.g. 'question' or 'acceptance'.
+            index(int): The index of the question template the message matched.
+            main_conference(dict): The conference and year of the question, or None.
+            entity(list): The entities of the question (papers, sessions, workshops or tutorials).
+            authors(list): The authors named in the question.
+            last_similarity(int): The rank of the answer returned last.
+            error_str(str): The clarification question to ask the user, or None.
+            last_DA(DialogueAct): The dialogue act a follow-up question refers to, or None.
+            flag(bool): False for follow-up questions, which reuse the slots of last_DA.
+            cursor(int): The id of the ranked answers of the question in the ResultCursorStore, or None.
+        """
+        self.intent = intent
+        self.index = index
+        self.main_conference = main_conference
+        self.entity = entity
+        self.authors = authors
+        self.last_similarity = last_similarity
+        self.error_str = error_str
+        self.last_DA = last_DA
+        self.flag = flag
+        self.cursor = cursor
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key.replace(' ', '_'))
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key.replace(' ', '_'), value)
+
+    def __delitem__(self, key):
+        raise TypeError('The keys of a DialogueAct cannot be deleted.')
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return 'DialogueAct({!r})'.format(dict(self.items()))
+
+    def to_dict(self):
+        """
+        Returns:
+            A plain dict of the dialogue act, with last DA converted as well.
+        """
+        da_dict = dict(self.items())
+        if isinstance(self.last_DA, DialogueAct):
+            da_dict['last DA'] = self.last_DA.to_dict()
+        return da_dict
+
+    @classmethod
+    def from_dict(cls, da_dict):
+        last_DA = da_dict.get('last DA')
+        return cls(da_dict.get('intent'), da_dict.get('index'), da_dict.get('main conference'), da_dict.get('entity'),
+                   da_dict.get('authors'), da_dict.get('last similarity', 0), da_dict.get('error str'),
+                   cls.from_dict(last_DA) if last_DA is not None else None, da_dict.get('flag', True),
+                   da_dict.get('cursor'))
+
+    def to_bytes(self):
+        return serialization.dumps(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_dict(serialization.loads(data))
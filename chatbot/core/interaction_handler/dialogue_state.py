@@ -0,0 +1,172 @@
+"""
+The per-user dialogue state store, holding the recent dialogue acts of each conversation.
+"""
+
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+from ..interaction_handler import serialization
+from ..interaction_handler.dialogue_act import DialogueAct
+
+_current_session = contextvars.ContextVar('current_session', default=None)
+
+
+class Session:
+    def __init__(self, user_id, acts, max_acts):
+        self.user_id = user_id
+        self.acts = deque(acts, maxlen=max_acts)
+        self.lock = threading.RLock()
+        self.active = 0
+
+
+class DialogueStateStore:
+    def __init__(self, max_acts=20, max_sessions=10000, path=None):
+        """
+        Keeps a bounded ring buffer of dialogue acts per user. The least recently used sessions are evicted once there
+        are more than max_sessions of them. If a path is given, evicted sessions are spilled to a local SQLite file
+        and loaded back when their user returns.
+        Args:
+            max_acts(int): The number of dialogue acts kept per user.
+            max_sessions(int): The number of sessions kept in memory.
+            path(str): The SQLite file evicted sessions are spilled to, or None to drop them.
+        """
+        self.max_acts = max_acts
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.path = path
+        self.db = None
+        self.open()
+
+    def open(self):
+        if self.path is not None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS dialogue_state (user_id TEXT PRIMARY KEY, acts TEXT)')
+            self.db.commit()
+
+    def reopen(self):
+        """
+        Opens a new connection to the spill file in a forked process. The connection inherited from the parent is
+        dropped without being used.
+        """
+        with self.lock:
+            self.db = None
+            self.open()
+
+    def get(self, user_id, pin=False):
+        """
+        Args:
+            pin(bool): Marks the session active before releasing the store lock, so that it cannot be evicted until
+            release() is called.
+        Returns:
+            The Session of the user, loaded from the spill file or created if needed.
+        """
+        with self.lock:
+            session = self.sessions.get(user_id)
+            if session is None:
+                session = Session(user_id, self.load(user_id), self.max_acts)
+                self.sessions[user_id] = session
+            else:
+                self.sessions.move_to_end(user_id)
+            if pin:
+                session.active += 1
+            self.evict()
+            return session
+
+    def release(self, session):
+        with self.lock:
+            session.active -= 1
+
+    @contextmanager
+    def session(self, user_id):
+        """
+        Makes the dialogue acts of a user the ones seen through SessionDAList while serving one of their requests.
+        Requests of the same user are serialized, while requests of different users run concurrently.
+        """
+        session = self.get(user_id, pin=True)
+        try:
+            with session.lock:
+                token = _current_session.set(session)
+                try:
+                    yield session
+                finally:
+                    _current_session.reset(token)
+        finally:
+            self.release(session)
+
+    def evict(self):
+        for user_id in list(self.sessions.keys()):
+            if len(self.sessions) <= self.max_sessions:
+                break
+            session = self.sessions[user_id]
+            if session.active > 0:
+                continue
+            del self.sessions[user_id]
+            self.spill(session)
+
+    def spill(self, session):
+        if self.db is None:
+            return
+        try:
+            self.db.execute('INSERT OR REPLACE INTO dialogue_state VALUES (?, ?)',
+                            (str(session.user_id), serialization.dumps([act.to_dict() for act in session.acts])))
+            self.db.commit()
+        except (TypeError, ValueError):
+            logging.exception('Could not spill the dialogue state of user {}'.format(session.user_id))
+
+    def load(self, user_id):
+        if self.db is None:
+            return []
+        row = self.db.execute('SELECT acts FROM dialogue_state WHERE user_id = ?', (str(user_id),)).fetchone()
+        if row is None:
+            return []
+        # spill files written before the binary format hold JSON text
+        acts = json.loads(row[0]) if isinstance(row[0], str) else serialization.loads(row[0])
+        return [DialogueAct.from_dict(act) for act in acts]
+
+    def close(self):
+        """
+        Spills every session kept in memory and closes the spill file.
+        """
+        with self.lock:
+            if self.db is not None:
+                for session in self.sessions.values():
+                    self.spill(session)
+                self.db.close()
+                self.db = None
+
+
+class SessionDAList:
+    def __init__(self, max_acts=20):
+        """
+        A list-like view of the dialogue acts of the user being served, most recent first. It is stored as
+        params['DA list'], so that every component reads the state of the current session. Outside of a session (e.g.
+        when a component is used on its own), a single default ring buffer is used.
+        Args:
+            max_acts(int): The number of dialogue acts kept in the default ring buffer.
+        """
+        self.default = deque(maxlen=max_acts)
+
+    def acts(self):
+        session = _current_session.get()
+        return self.default if session is None else session.acts
+
+    def insert(self, index, act):
+        if index != 0:
+            raise Exception('Dialogue acts can only be inserted at the front of the DA list.')
+        self.acts().appendleft(act)
+
+    def __getitem__(self, index):
+        return self.acts()[index]
+
+    def __len__(self):
+        return len(self.acts())
+
+    def __iter__(self):
+        return iter(list(self.acts()))
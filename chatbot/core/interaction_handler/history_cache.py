@@ -0,0 +1,84 @@
+"""
+An in-process cache of the recent messages of each user, in front of the interaction database.
+"""
+
+import threading
+
+from collections import deque, OrderedDict
+
+import util
+
+
+class ConversationHistoryCache:
+    def __init__(self, max_count=10, max_age=10 * 60 * 1000, max_users=10000):
+        """
+        Keeps the max_count most recent messages of each user that are at most max_age milliseconds old. A user is
+        cached once their history has been loaded from the database; after that, the messages written for them are
+        added to the cache as well, so their history no longer needs a database read. The least recently used users
+        are evicted once there are more than max_users of them.
+        Args:
+            max_count(int): The number of messages kept per user.
+            max_age(int): The age in milliseconds after which a message is dropped.
+            max_users(int): The number of users kept.
+        """
+        self.max_count = max_count
+        self.max_age = max_age
+        self.max_users = max_users
+        self.histories = OrderedDict()  # user_id -> deque of message dicts, oldest first
+        self.counts = {'hit': 0, 'miss': 0}
+        self.lock = threading.Lock()
+
+    def covers(self, max_time, max_count):
+        """
+        Checks if a history request fits in what is cached per user.
+        """
+        return max_time is not None and max_time <= self.max_age and max_count is not None and max_count <= self.max_count
+
+    def get(self, user_id, max_time, max_count):
+        """
+        Returns:
+            The message dicts of the user newer than max_time milliseconds, most recent first and at most max_count of
+            them, or None if the user is not cached.
+        """
+        with self.lock:
+            history = self.histories.get(user_id)
+            if history is None:
+                self.counts['miss'] += 1
+                return None
+            self.histories.move_to_end(user_id)
+            self.counts['hit'] += 1
+            self.trim(history)
+            min_timestamp = util.current_time_in_milliseconds() - max_time
+            return [msg_dict for msg_dict in reversed(history) if msg_dict['timestamp'] > min_timestamp][:max_count]
+
+    def load(self, user_id, msg_dicts):
+        """
+        Caches the history of a user read from the database, merged with the messages cached for them meanwhile.
+        """
+        with self.lock:
+            merged = {msg_dict['_id']: msg_dict for msg_dict in msg_dicts}
+            merged.update((msg_dict['_id'], msg_dict) for msg_dict in self.histories.get(user_id, ()))
+            history = deque(sorted(merged.values(), key=lambda msg_dict: msg_dict['timestamp']), maxlen=self.max_count)
+            self.trim(history)
+            self.histories[user_id] = history
+            self.histories.move_to_end(user_id)
+            while len(self.histories) > self.max_users:
+                self.histories.popitem(last=False)
+
+    def add(self, msg_dict):
+        """
+        Adds a message written to the database, if its user is cached.
+        """
+        with self.lock:
+            history = self.histories.get(msg_dict['user_id'])
+            if history is not None:
+                history.append(msg_dict)
+
+    def trim(self, history):
+        min_timestamp = util.current_time_in_milliseconds() - self.max_age
+        while len(history) > 0 and history[0]['timestamp'] <= min_timestamp:
+            history.popleft()
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, 'users': len(self.histories)}
@@ -3,8 +3,12 @@ The message used to represent each interaction in Macaw.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+from ..interaction_handler import serialization
+
 
 class Message:
+    __slots__ = ('user_interface', 'user_id', 'user_info', 'msg_info', 'text', 'timestamp')
+
     def __init__(self, user_interface, user_id, user_info, msg_info, text, timestamp):
         """
         An object for input and output Message.
@@ -23,6 +27,18 @@ class Message:
         self.timestamp = timestamp
         self.user_interface = user_interface
 
+    def to_dict(self):
+        """
+        Returns:
+            A dict with every field of the message, as read by from_dict.
+        """
+        return {'user_interface': self.user_interface,
+                'user_id': self.user_id,
+                'user_info': self.user_info,
+                'msg_info': self.msg_info,
+                'text': self.text,
+                'timestamp': self.timestamp}
+
     @classmethod
     def from_dict(cls, msg_dict):
         """
@@ -32,10 +48,19 @@ class Message:
         Returns:
             A Message object.
         """
-        user_interface = msg_dict['user_interface'] if 'user_interface' in msg_dict else None
-        user_id = msg_dict['user_id'] if 'user_id' in msg_dict else None
-        user_info = msg_dict['user_info'] if 'user_info' in msg_dict else None
-        msg_info = msg_dict['msg_info'] if 'msg_info' in msg_dict else None
-        text = msg_dict['text'] if 'text' in msg_dict else None
-        timestamp = msg_dict['timestamp'] if 'timestamp' in msg_dict else None
-        return cls(user_interface, user_id, user_info, msg_info, text, timestamp)
\ No newline at end of file
+        return cls(msg_dict.get('user_interface'), msg_dict.get('user_id'), msg_dict.get('user_info'),
+                   msg_dict.get('msg_info'), msg_dict.get('text'), msg_dict.get('timestamp'))
+
+    def to_bytes(self):
+        """
+        Returns:
+            The message serialized with the versioned binary format of core.interaction_handler.serialization.
+        """
+        return serialization.dumps(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_dict(serialization.loads(data))
+
+    def __repr__(self):
+        return 'Message({})'.format(', '.join('{}={!r}'.format(key, value) for key, value in self.to_dict().items()))
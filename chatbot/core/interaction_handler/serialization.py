@@ -0,0 +1,45 @@
+"""
+A versioned binary serialization of messages and dialogue acts, for storage and inter-process transfer.
+"""
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# every payload starts with the format version and the codec used for the rest of it
+FORMAT_VERSION = 1
+MSGPACK = 1
+JSON = 2
+
+
+def dumps(obj):
+    """
+    Serializes a structure of dicts, lists, strings, numbers, booleans and None. msgpack is used if it is installed,
+    JSON otherwise.
+    Args:
+        obj: The object to serialize.
+    Returns:
+        The bytes of the payload.
+    """
+    if msgpack is not None:
+        return bytes((FORMAT_VERSION, MSGPACK)) + msgpack.packb(obj, use_bin_type=True)
+    return bytes((FORMAT_VERSION, JSON)) + json.dumps(obj, separators=(',', ':')).encode('utf8')
+
+
+def loads(data):
+    """
+    Deserializes a payload written by dumps(), with any codec.
+    """
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        raise Exception('Unknown serialization format version!')
+    if data[1] == MSGPACK:
+        if msgpack is None:
+            raise Exception('msgpack is needed to read this payload.')
+        return msgpack.unpackb(data[2:], raw=False)
+    elif data[1] == JSON:
+        return json.loads(data[2:].decode('utf8'))
+    else:
+        raise Exception('Unknown serialization codec!')
@@ -0,0 +1,179 @@
+"""
+The storage backends of the interaction database: MongoDB, or an embedded SQLite file for single-box deployments.
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+
+from abc import ABC, abstractmethod
+
+from ..interaction_handler import serialization
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def new_id(self):
+        """
+        Returns:
+            A new unique message id, stored as the '_id' of the message dict.
+        """
+        pass
+
+    @abstractmethod
+    def insert_many(self, msg_dicts):
+        """
+        Writes a batch of message dicts.
+        """
+        pass
+
+    @abstractmethod
+    def find_history(self, user_id, min_timestamp, max_count):
+        """
+        Args:
+            user_id(str or int): The user ID.
+            min_timestamp(int): Only the messages strictly newer than this timestamp are returned. None means no limit.
+            max_count(int): The maximum number of messages returned. None means no limit.
+        Returns:
+            The message dicts of the user, most recent first.
+        """
+        pass
+
+    @abstractmethod
+    def find_all(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class MongoBackend(StorageBackend):
+    def __init__(self, host, port, dbname):
+        from bson import ObjectId
+        from pymongo import ASCENDING, DESCENDING, MongoClient
+
+        self.object_id = ObjectId
+        self.history_index = [('user_id', ASCENDING), ('timestamp', DESCENDING)]
+        self.client = MongoClient(host, port)
+        self.db = self.client[dbname]
+        self.col = self.db['macaw_msgs']
+        self.ensure_index()
+
+    def ensure_index(self):
+        """
+        Creates the (user_id, timestamp) index used by find_history(), and checks that it exists.
+        """
+        name = self.col.create_index(self.history_index)
+        index = self.col.index_information().get(name)
+        if index is None or [tuple(key) for key in index['key']] != self.history_index:
+            raise Exception('The (user_id, timestamp) index of the macaw_msgs collection is missing.')
+
+    def new_id(self):
+        return self.object_id()
+
+    def insert_many(self, msg_dicts):
+        self.col.insert_many(msg_dicts, ordered=False)
+
+    def find_history(self, user_id, min_timestamp, max_count):
+        query = {'user_id': user_id}
+        if min_timestamp is not None:
+            query['timestamp'] = {'$gt': min_timestamp}
+        res = self.col.find(query).sort([('timestamp', -1)])
+        if max_count is not None:
+            res = res.limit(max_count)
+        return list(res)
+
+    def find_all(self):
+        return self.col.find({})
+
+    def close(self):
+        self.client.close()
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path):
+        """
+        Stores the messages in a local SQLite file, serialized with serialization.dumps(). The file is in WAL mode so
+        that history reads are not blocked by writes, and each thread uses its own connection.
+        Args:
+            path(str): The SQLite file.
+        """
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        db = self.connection()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS macaw_msgs (id TEXT PRIMARY KEY, user_id TEXT, timestamp INTEGER, '
+                   'msg BLOB)')
+        db.execute('CREATE INDEX IF NOT EXISTS user_id_timestamp ON macaw_msgs (user_id, timestamp DESC)')
+        db.commit()
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            # with WAL, syncing at checkpoints only is safe against corruption, and much faster
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+            with self.lock:
+                self.connections.append(db)
+        return db
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def insert_many(self, msg_dicts):
+        rows = []
+        for msg_dict in msg_dicts:
+            msg = {key: value for key, value in msg_dict.items() if key != '_id'}
+            rows.append((msg_dict['_id'], json.dumps(msg_dict['user_id']), msg_dict['timestamp'],
+                         serialization.dumps(msg)))
+        db = self.connection()
+        # the whole batch is written in a single transaction
+        with db:
+            db.executemany('INSERT OR IGNORE INTO macaw_msgs VALUES (?, ?, ?, ?)', rows)
+
+    def find_history(self, user_id, min_timestamp, max_count):
+        query = 'SELECT id, msg FROM macaw_msgs WHERE user_id = ?'
+        args = [json.dumps(user_id)]
+        if min_timestamp is not None:
+            query += ' AND timestamp > ?'
+            args.append(min_timestamp)
+        query += ' ORDER BY timestamp DESC'
+        if max_count is not None:
+            query += ' LIMIT ?'
+            args.append(max_count)
+        return [self.msg_dict(msg_id, msg) for msg_id, msg in self.connection().execute(query, args)]
+
+    def find_all(self):
+        return [self.msg_dict(msg_id, msg)
+                for msg_id, msg in self.connection().execute('SELECT id, msg FROM macaw_msgs')]
+
+    @staticmethod
+    def msg_dict(msg_id, msg):
+        # rows written before the binary format hold JSON text
+        return {**(json.loads(msg) if isinstance(msg, str) else serialization.loads(msg)), '_id': msg_id}
+
+    def close(self):
+        with self.lock:
+            for db in self.connections:
+                db.close()
+            self.connections = []
+
+
+def get_storage_backend(params):
+    """
+    Creates the storage backend selected by params['interaction_db_backend']: 'mongo' (default), using
+    params['interaction_db_host'], params['interaction_db_port'] and params['interaction_db_name'], or 'sqlite', using
+    the file params['interaction_db_path'].
+    """
+    backend = params.get('interaction_db_backend', 'mongo')
+    if backend == 'mongo':
+        return MongoBackend(params['interaction_db_host'], params['interaction_db_port'], params['interaction_db_name'])
+    elif backend == 'sqlite':
+        return SQLiteBackend(params['interaction_db_path'])
+    else:
+        raise Exception('The requested interaction database backend does not exist!')
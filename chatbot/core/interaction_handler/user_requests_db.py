@@ -1,42 +1,114 @@
 """
-The conversation (or interaction) database implemented using MongoDB.
+The conversation (or interaction) database, stored with MongoDB or SQLite.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
-from pymongo import MongoClient
+import logging
+import threading
 
 import util
+from ..interaction_handler.history_cache import ConversationHistoryCache
 from ..interaction_handler.msg import Message
 
 
 class InteractionDB:
-    def __init__(self, host, port, dbname):
-        self.client = MongoClient(host, port)
-        self.db = self.client[dbname]
-        self.col = self.db['macaw_msgs']
+    def __init__(self, backend, flush_interval=0.1, flush_size=256, history_size=10,
+                 history_age=10 * 60 * 1000, history_users=10000):
+        """
+        The messages are written behind: insert_one() only queues a message, and a background thread writes the queued
+        messages with insert_many() every flush_interval seconds, or as soon as flush_size messages are queued. The
+        messages not written yet are still returned by get_conv_history(). close() writes the remaining messages.
+        The recent history of each user is also cached in memory, so a user's history is read from the database only
+        the first time it is requested by this process.
+        Args:
+            backend(StorageBackend): Where the messages are stored.
+            flush_interval(float): The maximum time in seconds a message stays in the queue.
+            flush_size(int): The number of queued messages that triggers a write.
+            history_size(int): The number of recent messages cached per user.
+            history_age(int): The age in milliseconds after which a cached message is dropped.
+            history_users(int): The number of users whose history is cached.
+        """
+        self.backend = backend
+        self.history = ConversationHistoryCache(history_size, history_age, history_users)
+
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = []  # queued messages
+        self.flushing = []  # messages being written
+        self.closed = False
+        self.cond = threading.Condition()
+        self.writer = threading.Thread(target=self.write_behind, daemon=True)
+        self.writer.start()
 
     def insert_one(self, msg):
         if msg.user_id is None or msg.text is None or msg.timestamp is None or msg.user_interface is None:
             raise Exception('Each message should include a user_interface, user_id, text, and timestamp.')
-        self.col.insert_one(msg.__dict__)
+        # the id is set here, so that a message read both from the queue and from the collection is only returned once
+        msg_dict = {**msg.to_dict(), '_id': self.backend.new_id()}
+        with self.cond:
+            if self.closed:
+                raise Exception('The interaction database is closed.')
+            self.pending.append(msg_dict)
+            self.history.add(msg_dict)
+            if len(self.pending) >= self.flush_size:
+                self.cond.notify()
+
+    def write_behind(self):
+        while True:
+            with self.cond:
+                if len(self.pending) < self.flush_size and not self.closed:
+                    self.cond.wait(self.flush_interval)
+                if len(self.pending) == 0:
+                    if self.closed:
+                        return
+                    continue
+                self.flushing, self.pending = self.pending, []
+            try:
+                self.backend.insert_many(self.flushing)
+            except Exception:
+                logging.exception('Could not write {} messages'.format(len(self.flushing)))
+            with self.cond:
+                self.flushing = []
 
     def get_all(self):
         print('Using get_all is only recommended for development purposes. It is not efficient!')
-        return self.dict_list_to_msg_list(self.col.find({}))
+        return self.dict_list_to_msg_list(self.backend.find_all())
 
     def get_conv_history(self, user_id, max_time, max_count):
-        if max_time is None:
-            res = self.col.find({'user_id': user_id}).sort([('timestamp', -1)])
-        else:
-            res = self.col.find({'user_id': user_id,
-                                 'timestamp': {'$gt': util.current_time_in_milliseconds() - max_time}}).sort([('timestamp', -1)])
+        if self.history.covers(max_time, max_count):
+            msg_dicts = self.history.get(user_id, max_time, max_count)
+            if msg_dicts is None:
+                # after a restart, or once the user was evicted, their history is read from the database once
+                msg_dicts = self.query_history(user_id, self.history.max_age, self.history.max_count)
+                self.history.load(user_id, msg_dicts)
+                msg_dicts = self.history.get(user_id, max_time, max_count)
+            return self.dict_list_to_msg_list(msg_dicts)
+        return self.dict_list_to_msg_list(self.query_history(user_id, max_time, max_count))
 
-        if max_count is not None:
-            res = res.limit(max_count)
-        return self.dict_list_to_msg_list(res)
+    def query_history(self, user_id, max_time, max_count):
+        """
+        Returns:
+            The message dicts of the user from the database and the write queue, most recent first.
+        """
+        with self.cond:
+            unwritten = [msg_dict for msg_dict in self.flushing + self.pending if msg_dict['user_id'] == user_id]
+        min_timestamp = None if max_time is None else util.current_time_in_milliseconds() - max_time
+        res = self.backend.find_history(user_id, min_timestamp, max_count)
+        if min_timestamp is not None:
+            unwritten = [msg_dict for msg_dict in unwritten if msg_dict['timestamp'] > min_timestamp]
+        if len(unwritten) == 0:
+            return res
+        msg_dicts = {msg_dict['_id']: msg_dict for msg_dict in unwritten}
+        msg_dicts.update((msg_dict['_id'], msg_dict) for msg_dict in res)
+        msg_dicts = sorted(msg_dicts.values(), key=lambda msg_dict: msg_dict['timestamp'], reverse=True)
+        return msg_dicts[:max_count]
 
     def close(self):
-        self.client.close()
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.writer.join()
+        self.backend.close()
 
     @staticmethod
     def dict_list_to_msg_list(msg_dict_list):
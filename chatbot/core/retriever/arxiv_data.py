@@ -0,0 +1,54 @@
+"""
+Streaming readers of the arXiv dump (see the 'arxiv path' parameter).
+"""
+
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def iter_arxiv_records(path):
+    """
+    Yields the records of the arXiv dump one at a time, so that the dump never needs to fit in memory. The dump is
+    either a JSON object mapping each paper key to its record (arxiv_parsed.json), parsed incrementally with ijson, or
+    a JSON lines file (.jsonl) with one record per line, as in the Kaggle arXiv metadata snapshot. Without ijson, a
+    JSON object dump is loaded at once.
+    Args:
+        path(str): The path of the dump.
+    Returns:
+        An iterator of (key, record) tuples. The key of a JSON lines record is its 'id', or its line number.
+    """
+    with open(path, 'rb') as f:
+        if path.endswith('.jsonl'):
+            for i, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    yield str(record.get('id', i)), record
+        elif ijson is not None:
+            # use_float avoids Decimal values, which json cannot encode afterwards
+            for key, record in ijson.kvitems(f, '', use_float=True):
+                yield key, record
+        else:
+            for key, record in json.load(f).items():
+                yield key, record
+
+
+def arxiv_authors(record):
+    """
+    Returns:
+        The author names of an arXiv record, as 'first middle last' strs. 'authors_parsed' ([last, first, suffix]
+        lists) is used if present, otherwise the 'authors' str or list.
+    """
+    if record.get('authors_parsed'):
+        names = []
+        for parts in record['authors_parsed']:
+            last, first = parts[0], parts[1] if len(parts) > 1 else ''
+            names.append(' '.join(p for p in (first, last) if p).strip())
+        return [name for name in names if name]
+    authors = record.get('authors', [])
+    if isinstance(authors, str):
+        authors = authors.replace(' and ', ', ').split(',')
+    return [name.strip() for name in authors if name.strip()]
@@ -0,0 +1,59 @@
+"""
+The dense index of the arXiv dump answering paper questions, built offline since encoding the dump takes hours.
+"""
+
+import argparse
+import logging
+import os
+
+from ..retriever.arxiv_data import iter_arxiv_records
+from ..retriever.dense_retriever import DenseRetriever
+from ..retriever.embedding_pipeline import EmbeddingPipeline
+
+MODEL_NAME = 'multi-qa-mpnet-base-dot-v1'
+
+
+def arxiv_index_path(index_dir):
+    return '{}/arxiv_index.pkl'.format(index_dir)
+
+
+def build_arxiv_index(arxiv_path, index_dir, model=None, batch_size=256, workers=None, records=None):
+    """
+    Builds and saves the dense index of the arXiv dump. The dump is streamed, and the vectors are stored by an
+    EmbeddingPipeline, so an interrupted build resumes where it stopped.
+    Args:
+        arxiv_path(str): The arXiv dump.
+        index_dir(str): The directory of the index and of the vector store.
+        model(SentenceTransformer): An already loaded MODEL_NAME model, or None to load it.
+        batch_size(int): The number of documents per encoded batch.
+        workers(int): The number of encoding processes, by default min(4, CPU count).
+        records(int): The number of records of the dump, used to report the ETA, or None.
+    Returns:
+        The DenseRetriever of the index.
+    """
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME)
+    dense_index = DenseRetriever(model)
+    pipeline = EmbeddingPipeline(MODEL_NAME, '{}/arxiv_vectors'.format(index_dir), batch_size=batch_size,
+                                 workers=workers if workers is not None else min(4, os.cpu_count() or 1), model=model)
+    documents = ((key, (record.get('title') or '') + ' ' + (record.get('abstract') or ''))
+                 for key, record in iter_arxiv_records(arxiv_path))
+    dense_index.vector_index.vectors = pipeline.run(documents, records)
+    dense_index.vector_index.build(dense_index.use_gpu)
+    dense_index.save_index(index_path=arxiv_index_path(index_dir))
+    return dense_index
+
+
+if __name__ == '__main__':
+    # python -m core.retriever.arxiv_index <arxiv dump> <index directory>, from the chatbot directory
+    parser = argparse.ArgumentParser(description='Builds the dense index of the arXiv dump used by paper questions.')
+    parser.add_argument('arxiv_path')
+    parser.add_argument('index_dir')
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--records', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    build_arxiv_index(args.arxiv_path, args.index_dir, batch_size=args.batch_size, workers=args.workers,
+                      records=args.records)
@@ -0,0 +1,167 @@
+"""
+An offline author -> papers store built from the arXiv dump, answering author profile lookups without the network.
+"""
+
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+
+from ..input_handler.author_gazetteer import name_tokens
+from ..retriever.arxiv_data import arxiv_authors, iter_arxiv_records
+
+
+def name_key(name):
+    """
+    The normalized form of a person name indexed by the store: the first and last name tokens, lowercased and without
+    accents, so that 'Jérôme K. Dupont' and 'Jerome Dupont' share a key.
+    """
+    tokens = name_tokens(name)
+    if len(tokens) == 0:
+        return ''
+    return tokens[0] if len(tokens) == 1 else tokens[0] + ' ' + tokens[-1]
+
+
+def title_key(title):
+    return ' '.join((title or '').split()).lower()
+
+
+class AuthorProfileStore:
+    def __init__(self, path):
+        """
+        A local SQLite store of arXiv papers (title, abstract and categories) and of their authors, indexed by
+        normalized name and by paper.
+        Args:
+            path(str): The SQLite file.
+        """
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('CREATE TABLE IF NOT EXISTS papers (id TEXT PRIMARY KEY, title TEXT, abstract TEXT, '
+                        'categories TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS authors (name_key TEXT, name TEXT, paper_id TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS authors_name_key ON authors (name_key)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS authors_paper_id ON authors (paper_id)')
+        self.db.commit()
+
+    def build(self, arxiv_path, batch_size=10000):
+        """
+        Streams the arXiv dump into the store, writing batch_size papers per transaction.
+        Returns:
+            The number of papers stored.
+        """
+        papers, authors, count, start = [], [], 0, time.time()
+        for key, record in iter_arxiv_records(arxiv_path):
+            # titles and abstracts of the dump are wrapped over several lines
+            papers.append((key, ' '.join((record.get('title') or '').split()),
+                           ' '.join((record.get('abstract') or '').split()), record.get('categories') or ''))
+            authors.extend((name_key(name), name, key) for name in arxiv_authors(record))
+            if len(papers) >= batch_size:
+                count += self.write(papers, authors)
+                papers, authors = [], []
+                logging.info('Stored {} papers ({:.0f} papers/s)'.format(count, count / (time.time() - start)))
+        count += self.write(papers, authors)
+        logging.info('Stored {} papers'.format(count))
+        return count
+
+    def write(self, papers, authors):
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)', papers)
+            self.db.executemany('DELETE FROM authors WHERE paper_id = ?', [(paper[0],) for paper in papers])
+            self.db.executemany('INSERT INTO authors VALUES (?, ?, ?)', authors)
+        return len(papers)
+
+    def has_author(self, name):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM authors WHERE name_key = ? LIMIT 1', (name_key(name),)).fetchone() \
+                is not None
+
+    def profile(self, name, titles):
+        """
+        Returns the papers of the author with the given name who wrote the papers with the given titles. Authors with
+        the same normalized name are told apart by their co-authors: the papers of the name are split into groups
+        linked by chains of shared co-authors, each group being one author. The author is the group holding the most
+        of the titled papers.
+        Args:
+            name(str): The author name.
+            titles(list): A str list of titles of papers of the author.
+        Returns:
+            An (author key, list of papers) tuple, where papers are dicts with a 'title', an 'abstract' and
+            'categories'. The key (the normalized name and the smallest paper id of the group) identifies the author
+            in the store whatever titles are given. It is (None, []) when none of the titles is a paper of the store
+            with an author of that name.
+        """
+        key = name_key(name)
+        titles = {title_key(title) for title in titles}
+        with self.lock:
+            rows = self.db.execute('SELECT p.id, p.title, p.abstract, p.categories FROM authors a '
+                                   'JOIN papers p ON p.id = a.paper_id WHERE a.name_key = ?', (key,)).fetchall()
+            papers = {row[0]: row for row in rows}
+            found = [paper_id for paper_id, row in papers.items() if title_key(row[1]) in titles]
+            if len(found) == 0:
+                return None, []
+            coauthors = {}  # paper id -> co-author keys
+            ids = list(papers)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                for paper_id, coauthor in self.db.execute('SELECT paper_id, name_key FROM authors WHERE paper_id IN '
+                                                          '({})'.format(','.join('?' * len(chunk))), chunk):
+                    if coauthor != key:
+                        coauthors.setdefault(paper_id, set()).add(coauthor)
+
+        group = self.author_groups(sorted(papers), coauthors)
+        counts = {}
+        for paper_id in found:
+            counts[group[paper_id]] = counts.get(group[paper_id], 0) + 1
+        author = min(counts, key=lambda first: (-counts[first], first))
+        linked = sorted(paper_id for paper_id in papers if group[paper_id] == author)
+        return '{}:{}'.format(key, author), [{'title': papers[paper_id][1], 'abstract': papers[paper_id][2],
+                                             'categories': papers[paper_id][3]} for paper_id in linked]
+
+    @staticmethod
+    def author_groups(paper_ids, coauthors):
+        """
+        Splits papers into groups linked by chains of shared co-authors.
+        Args:
+            paper_ids(list): The sorted paper ids.
+            coauthors(dict): The co-author keys of each paper.
+        Returns:
+            A dict from each paper id to the smallest paper id of its group.
+        """
+        papers_of = {}  # co-author key -> paper ids
+        for paper_id, keys in coauthors.items():
+            for coauthor in keys:
+                papers_of.setdefault(coauthor, []).append(paper_id)
+        group, seen = {}, set()
+        for first in paper_ids:
+            if first in group:
+                continue
+            group[first] = first
+            pending = [first]
+            while pending:
+                for coauthor in coauthors.get(pending.pop(), ()):
+                    if coauthor in seen:
+                        continue
+                    seen.add(coauthor)
+                    for paper_id in papers_of[coauthor]:
+                        if paper_id not in group:
+                            group[paper_id] = first
+                            pending.append(paper_id)
+        return group
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+if __name__ == '__main__':
+    # python -m core.retriever.author_store <arxiv dump> <store file>, from the chatbot directory
+    parser = argparse.ArgumentParser(description='Builds the offline author profile store from the arXiv dump.')
+    parser.add_argument('arxiv_path')
+    parser.add_argument('store_path')
+    parser.add_argument('--batch_size', type=int, default=10000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    store = AuthorProfileStore(args.store_path)
+    store.build(args.arxiv_path, args.batch_size)
+    store.close()
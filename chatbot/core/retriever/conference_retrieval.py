@@ -1,9 +1,14 @@
 import json
+import threading
+
+import numpy as np
 
 from sentence_transformers import SentenceTransformer
-from ..retriever.dense_retriever import DenseRetriever
+from ..input_handler.turn_context import current_turn
 from ..retriever.sparse_retriever import SparseRetriever
+from ..retriever.paper_index import PaperIndex
 from ..retriever.paper_retriever import PaperRetrieval
+from ..retriever.profile_vectors import ProfileVectorCache
 
 class ConferenceRetrieval():
     def __init__(self, params):
@@ -11,10 +16,16 @@ class ConferenceRetrieval():
 
         self.data = self.get_data()
 
-        self.model = SentenceTransformer('sentence-transformers/allenai-specter')
-        self.dense_index = DenseRetriever(self.model)
+        self.model_name = 'sentence-transformers/allenai-specter'
+        self.model = SentenceTransformer(self.model_name)
+        self.entity_embeddings = {}  # (conference, entity, name) -> normalized embedding
+        self.paper_index = PaperIndex(self.model, self.data)
+        self.profile_vectors = ProfileVectorCache(self.model, self.params.get('profile ttl', 24 * 3600),
+                                                  self.params.get('profile cache size', 10000))
 
-        self.sparse_retriever = SparseRetriever()
+        # sparse indexes are built once per (conference, entity) and only read afterwards, so requests can share them
+        self.sparse_indexes = {}
+        self.sparse_lock = threading.Lock()
 
 
     def get_data(self):
@@ -23,6 +34,16 @@ class ConferenceRetrieval():
             data = json.load(f)
         f.close()
         return data
+
+    def reload_data(self):
+        """
+        Reloads the conference dataset, and drops the embeddings and indexes built from the previous one.
+        """
+        self.data = self.get_data()
+        self.entity_embeddings = {}
+        self.paper_index = PaperIndex(self.model, self.data)
+        with self.sparse_lock:
+            self.sparse_indexes = {}
     
     def get_attr(self, conf, entity, attr):
         lst = []
@@ -36,6 +57,17 @@ class ConferenceRetrieval():
                         lst.append(e[attr])
         return lst
     
+    def sparse_index(self, conf, entity):
+        """
+        Returns the sparse index over the names of every entity of a conference, building it on first use.
+        """
+        with self.sparse_lock:
+            if (conf, entity) not in self.sparse_indexes:
+                sparse_retriever = SparseRetriever()
+                sparse_retriever.index_documents(self.get_attr(conf, entity, 'name'))
+                self.sparse_indexes[(conf, entity)] = sparse_retriever
+            return self.sparse_indexes[(conf, entity)]
+
     def search(self, conf, entity, name):
         for key, value in self.data.items():
             if key == conf:
@@ -57,8 +89,7 @@ class ConferenceRetrieval():
             return 'too many entities'
         
         session_names = self.get_attr(wanted_conf, entities[0], 'name')
-        self.sparse_retriever.index_documents(session_names)
-        sparse_results = self.sparse_retriever.search([conv_list[0].text])[0]
+        sparse_results = self.sparse_index(wanted_conf, entities[0]).search([conv_list[0].text])[0]
         sparse_results = [r[0] for r in sparse_results][0]
 
         return self.search(wanted_conf, entities[0], session_names[sparse_results])['date']
@@ -71,8 +102,7 @@ class ConferenceRetrieval():
         names = []
         for entity in entities:
             valid = self.get_attr(wanted_conf, entity, 'name')
-            self.sparse_retriever.index_documents(valid)
-            sparse_results = self.sparse_retriever.search([conv_list[0].text])[0]
+            sparse_results = self.sparse_index(wanted_conf, entity).search([conv_list[0].text])[0]
             sparse_results = [i[0] for i in sparse_results][0]
             names.append(valid[sparse_results])
         
@@ -129,14 +159,58 @@ class ConferenceRetrieval():
         
         return result
     
-    def best_entity(self, conv_list, authors_wanted=False):
+    def query_vector(self, text):
+        """
+        Returns the embedding of the user message, computed once per turn.
+        """
+        return current_turn().embedding(self.model_name, self.model, text)
+
+    def entity_document(self, conf, entity, name):
+        titles = []
+        if entity == 'session':
+            titles = list(self.search(conf, entity, name)['paper titles'])
+        else:
+            titles = [self.search(conf, entity, name)['abstract']]
+        titles.append(name)
+        large_str = ''
+        for t in titles:
+            large_str = large_str + ' ' + t
+        return large_str
+
+    def entity_vectors(self, conf, entity, names):
+        """
+        Returns the normalized embeddings of the given sessions, workshops or tutorials (paper titles or abstract, and
+        name). Embeddings are computed in one batch the first time they are needed and kept afterwards.
+        """
+        missing = [n for n in names if (conf, entity, n) not in self.entity_embeddings]
+        if len(missing) > 0:
+            vectors = np.asarray(self.model.encode([self.entity_document(conf, entity, n) for n in missing],
+                                                   batch_size=32), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            for n, v in zip(missing, vectors):
+                self.entity_embeddings[(conf, entity, n)] = v
+        return np.array([self.entity_embeddings[(conf, entity, n)] for n in names])
+
+    def rank_entities(self, conv_list, authors_wanted=False, query=None):
+        """
+        Ranks the sessions, workshops or tutorials of the conference by their similarity with the user message, or
+        with the given normalized query vector.
+        """
         curr_da = self.params['DA list'][0]
         wanted_conf = curr_da['main conference']['conference'] + curr_da['main conference']['year']
         entities = curr_da['entity']
 
+        # dense ranking needs the query (and possibly some candidates) encoded; sparse ranking is the cheaper fallback
+        turn = current_turn()
+        dense = query is not None or turn.deadline.allows(self.params.get('dense budget', 1.0))
+        if query is None and dense:
+            query = np.asarray(self.query_vector(conv_list[0].text), dtype=np.float32)
+            query = query / np.linalg.norm(query)
+        elif not dense:
+            turn.degrade('entity ranking')
+
         recommendations = {}
         for entity in entities:
-            similarities = []
             names = []
             if authors_wanted:
                 dict = self.where_author()
@@ -148,24 +222,39 @@ class ConferenceRetrieval():
                             names.append(n)
             else:
                 names = self.get_attr(wanted_conf, entity, 'name')
-            for n in names:
-                titles = []
-                if entity == 'session':
-                    titles = self.search(wanted_conf, entity, n)['paper titles']
-                else:
-                    titles = [self.search(wanted_conf, entity, n)['abstract']]
-                titles.append(n)
-                large_str = ''
-                for t in titles:
-                    large_str = large_str + ' ' + t
-                self.dense_index.create_index_from_documents([large_str])
-                dense_results = self.dense_index.search([conv_list[0].text])[0]
-                dense_results = [i[1] for i in dense_results][0]
-                similarities.append(dense_results)
-            recommendations[entity] = names[similarities.index(max(similarities))]
+            if dense:
+                similarities = self.entity_vectors(wanted_conf, entity, names) @ query
+                recommendations[entity] = [names[i] for i in np.argsort(-similarities)]
+            else:
+                recommendations[entity] = self.sparse_rank(wanted_conf, entity, names, conv_list[0].text)
         
         return recommendations
 
+    def sparse_rank(self, conf, entity, names, text):
+        """
+        Ranks the given entity names by their sparse (BM25) similarity with text. Names without any matching term
+        keep their original order, after the matching ones.
+        """
+        all_names = self.get_attr(conf, entity, 'name')
+        sparse_results = self.sparse_index(conf, entity).search([text])[0]
+        ranked = [all_names[i[0]] for i in sparse_results if all_names[i[0]] in names]
+        return ranked + [n for n in names if n not in ranked]
+
+    @staticmethod
+    def zip_rankings(rankings):
+        """
+        Turns a dict from entity to ranked names into a ranked list of recommendations, each recommending one name per
+        entity. Entities with fewer candidates keep recommending their last one.
+        """
+        if isinstance(rankings, str):
+            return rankings
+        length = max([len(names) for names in rankings.values()] + [0])
+        return [{entity: names[min(i, len(names) - 1)] for entity, names in rankings.items()} for i in range(length)]
+
+    def best_entity(self, conv_list, authors_wanted=False):
+        ranked = self.zip_rankings(self.rank_entities(conv_list, authors_wanted))
+        return ranked if isinstance(ranked, str) else ranked[0]
+
     def get_papers(self, conv_list):
         curr_da = self.params['DA list'][0]
         wanted_conf = curr_da['main conference']['conference'] + curr_da['main conference']['year']
@@ -174,36 +263,52 @@ class ConferenceRetrieval():
         if 'session' not in entities:
             return 'only session has papers'
         
-        names = self.get_attr(wanted_conf, 'session', 'name')
-        self.sparse_retriever.index_documents(names)
-        sparse_results = self.sparse_retriever.search([conv_list[0].text])[0]
+        return self.search(wanted_conf, 'session', self.best_session(wanted_conf, conv_list))['paper titles']
+
+    def best_session(self, conf, conv_list):
+        """
+        Returns the name of the session of the conference whose name is the closest to the user message (BM25).
+        """
+        names = self.get_attr(conf, 'session', 'name')
+        sparse_results = self.sparse_index(conf, 'session').search([conv_list[0].text])[0]
         sparse_results = [i[0] for i in sparse_results][0]
-        titles = self.search(wanted_conf, 'session', names[sparse_results])['paper titles']
-        return titles
+        return names[sparse_results]
     
-    def best_paper_title(self, conv_list):
+    def rank_paper_titles(self, conv_list):
         curr_da = self.params['DA list'][0]
+        wanted_conf = curr_da['main conference']['conference'] + curr_da['main conference']['year']
         entities = curr_da['entity']
 
         if len(entities) > 1 or entities[0] != 'session':
             return 'only session has papers'
         
-        titles = self.get_papers(conv_list)
-        print(titles)
-        self.dense_index.create_index_from_documents(titles)
-        dense_results = self.dense_index.search([conv_list[0].text])[0]
-        dense_results = [i[0] for i in dense_results][0]
-        return titles[dense_results]
+        session = self.best_session(wanted_conf, conv_list)
+        if not current_turn().deadline.allows(self.params.get('dense budget', 1.0)):
+            current_turn().degrade('paper ranking')
+            return list(self.search(wanted_conf, 'session', session)['paper titles'])
+        # the paper vectors are prebuilt, so ranking is a single search restricted to the papers of the session
+        query = np.asarray(self.query_vector(conv_list[0].text), dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        return [title for title, _ in self.paper_index.search(query, key=wanted_conf, session=session)]
 
-    def related_author_session(self, conv_list, paper_retrieval):
+    def best_paper_title(self, conv_list):
+        ranked = self.rank_paper_titles(conv_list)
+        return ranked if isinstance(ranked, str) else ranked[0]
+
+    def rank_related_author_session(self, conv_list, paper_retrieval):
         curr_da = self.params['DA list'][0]
         curr_da['authors'] = [curr_da['authors'][0]]
         authors = curr_da['authors']
 
-        author_data = paper_retrieval.user_profile(authors[0], conv_list[0].text)
-        author_data = " ".join(author_data)
-        recommendation = self.best_entity(conv_list)
-        return recommendation
+        # the sessions are ranked by their similarity with the author's works, and by the user message when the
+        # author cannot be found
+        author_id, works = paper_retrieval.author_profile(authors[0], conv_list[0].text)
+        query = self.profile_vectors.vector(author_id, works) if author_id is not None else None
+        return self.zip_rankings(self.rank_entities(conv_list, query=query))
+
+    def related_author_session(self, conv_list, paper_retrieval):
+        ranked = self.rank_related_author_session(conv_list, paper_retrieval)
+        return ranked if isinstance(ranked, str) else ranked[0]
     
     def get_results(self, conv_list, index):
         if index in range(0,2):
@@ -219,4 +324,15 @@ class ConferenceRetrieval():
         if index in range(7,9):
             return self.related_author_session(conv_list, self.params['actions']['retrieval'])
         if index in range(9,11):
-            return self.best_paper_title(conv_list)
\ No newline at end of file
+            return self.best_paper_title(conv_list)
+
+    def get_ranked_results(self, conv_list, index):
+        """
+        Returns the full ranked list of answers, best first, for the questions answered by a single best match.
+        """
+        if index in range(4,6):
+            return self.zip_rankings(self.rank_entities(conv_list, len(self.params['DA list'][0]['authors']) > 0))
+        if index in range(7,9):
+            return self.rank_related_author_session(conv_list, self.params['actions']['retrieval'])
+        if index in range(9,11):
+            return self.rank_paper_titles(conv_list)
@@ -30,6 +30,9 @@ class DenseRetriever:
 
     def search(self, queries, limit=1000, probes=512, min_similarity=0):
         vectors = self.model.encode(queries, batch_size=self.batch_size)
+        return self.search_by_vectors(vectors, limit, probes, min_similarity)
+
+    def search_by_vectors(self, vectors, limit=1000, probes=512, min_similarity=0):
         ids, similarities = self.vector_index.search(vectors, k=limit, probes=probes)
         results = []
         for j in range(len(ids)):
@@ -0,0 +1,155 @@
+"""
+A streaming, checkpointed document embedding pipeline, used to build the dense index of the arXiv dump.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from collections import deque
+
+import numpy as np
+
+# the model of a worker process, loaded once by _init_worker()
+_model = None
+
+
+def _init_worker(model_name, threads):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # the workers share the CPU cores instead of each using all of them
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name)
+
+
+def _encode(documents, batch_size):
+    return _model.encode(documents, batch_size=batch_size, convert_to_numpy=True)
+
+
+class EmbeddingPipeline:
+    def __init__(self, model_name, store_path, dim=768, batch_size=256, encode_batch_size=64, workers=1, model=None):
+        """
+        Encodes a stream of documents in fixed-size batches and appends the vectors to a float32 file on disk, read
+        back as a memory map. The batches are encoded by a pool of worker processes, each with its own copy of the
+        model, and are written in input order. A checkpoint saved after each written batch lets an interrupted run
+        resume after the last written document.
+        Args:
+            model_name(str): The sentence-transformers model.
+            store_path(str): The prefix of the store files: <store_path>.f32 (vectors), <store_path>.keys (the key of
+                each document, one per line) and <store_path>.checkpoint.
+            dim(int): The dimension of the vectors.
+            batch_size(int): The number of documents per batch sent to a worker.
+            encode_batch_size(int): The batch size of the model.
+            workers(int): The number of worker processes. With 1, batches are encoded in this process.
+            model(SentenceTransformer): An already loaded model, used when workers is 1.
+        """
+        self.model_name = model_name
+        self.vectors_path = store_path + '.f32'
+        self.keys_path = store_path + '.keys'
+        self.checkpoint_path = store_path + '.checkpoint'
+        self.dim = dim
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.workers = workers
+        self.model = model
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {'documents': 0, 'keys offset': 0, 'model': self.model_name, 'dim': self.dim}
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['model'] != self.model_name or checkpoint['dim'] != self.dim:
+            raise Exception('The vector store was built with another model.')
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        with open(self.checkpoint_path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+    def vectors(self):
+        """
+        Returns:
+            The stored vectors, as a read-only memory map of shape (number of documents, dim).
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint['documents'] == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(checkpoint['documents'], self.dim))
+
+    def run(self, documents, total=None):
+        """
+        Encodes the documents not stored yet.
+        Args:
+            documents(iterable): The (key, text) tuples of all the documents, in a stable order. The documents already
+                stored by a previous run are skipped.
+            total(int): The total number of documents, used to report the ETA.
+        Returns:
+            The stored vectors (see vectors()).
+        """
+        checkpoint = self.load_checkpoint()
+        done = checkpoint['documents']
+        # anything written after the last checkpoint belongs to a batch that did not complete
+        for path, size in ((self.vectors_path, done * self.dim * 4), (self.keys_path, checkpoint['keys offset'])):
+            if os.path.exists(path):
+                os.truncate(path, size)
+        if done > 0:
+            logging.info('Resuming after {} documents'.format(done))
+
+        documents = iter(documents)
+        for _ in range(done):
+            next(documents, None)
+        batches = iter(lambda: [document for _, document in zip(range(self.batch_size), documents)], [])
+
+        start, encoded = time.time(), 0
+        with open(self.vectors_path, 'ab') as vectors_file, open(self.keys_path, 'a', encoding='utf8') as keys_file:
+            def write(keys, vectors):
+                nonlocal encoded
+                vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                vectors_file.flush()
+                keys_file.write(''.join(str(key).replace('\n', ' ') + '\n' for key in keys))
+                keys_file.flush()
+                encoded += len(keys)
+                checkpoint.update({'documents': done + encoded, 'keys offset': keys_file.tell()})
+                self.save_checkpoint(checkpoint)
+                self.report(done + encoded, encoded, start, total)
+
+            if self.workers > 1:
+                context = multiprocessing.get_context('spawn')
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                with context.Pool(self.workers, initializer=_init_worker, initargs=(self.model_name, threads)) as pool:
+                    # a bounded number of batches is in flight, so the documents are streamed rather than read at once
+                    pending = deque()
+                    for batch in batches:
+                        keys, texts = zip(*batch)
+                        pending.append((keys, pool.apply_async(_encode, (list(texts), self.encode_batch_size))))
+                        if len(pending) >= 2 * self.workers:
+                            keys, result = pending.popleft()
+                            write(keys, result.get())
+                    while len(pending) > 0:
+                        keys, result = pending.popleft()
+                        write(keys, result.get())
+            else:
+                if self.model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self.model = SentenceTransformer(self.model_name)
+                for batch in batches:
+                    keys, texts = zip(*batch)
+                    write(keys, self.model.encode(list(texts), batch_size=self.encode_batch_size,
+                                                  convert_to_numpy=True))
+        return self.vectors()
+
+    @staticmethod
+    def report(done, encoded, start, total):
+        elapsed = max(time.time() - start, 1e-9)
+        throughput = encoded / elapsed
+        if total is not None and throughput > 0:
+            eta = (total - done) / throughput
+            logging.info('Encoded {}/{} documents ({:.1f} docs/s, ETA {:.0f} min)'.format(
+                done, total, throughput, eta / 60))
+        else:
+            logging.info('Encoded {} documents ({:.1f} docs/s)'.format(done, throughput))
@@ -0,0 +1,67 @@
+"""
+A paper-level embedding index over every accepted paper of the loaded conferences, searchable with metadata filters.
+"""
+
+import logging
+import re
+
+import numpy as np
+
+
+class PaperIndex:
+    def __init__(self, model, data, batch_size=32):
+        """
+        Encodes the title of every paper listed in the sessions of the conference data once, and keeps for each vector
+        the conference key (e.g. 'SIGIR2021'), conference name, year and session of the paper. A search scores only
+        the vectors whose metadata match the given filters, which select a sub-matrix of the index.
+        Args:
+            model(SentenceTransformer): The model the titles are encoded with. Queries must be encoded with it too.
+            data(dict): The conference data (see ConferenceRetrieval.get_data()).
+            batch_size(int): The batch size of the model.
+        """
+        titles, metadata = [], {'key': [], 'conference': [], 'year': [], 'session': []}
+        for key, conference in data.items():
+            match = re.fullmatch(r'(.*?)(\d{4})', key)
+            name, year = (match.group(1), match.group(2)) if match is not None else (key, None)
+            for session in conference.get('session', []):
+                for title in session.get('paper titles', []):
+                    titles.append(title)
+                    metadata['key'].append(key)
+                    metadata['conference'].append(name)
+                    metadata['year'].append(year)
+                    metadata['session'].append(session['name'])
+        self.titles = titles
+        self.metadata = {field: np.array(values, dtype=object) for field, values in metadata.items()}
+        logging.info('Encoding {} paper titles'.format(len(titles)))
+        if len(titles) > 0:
+            vectors = np.asarray(model.encode(titles, batch_size=batch_size), dtype=np.float32)
+            self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def filter(self, **filters):
+        """
+        Returns:
+            The ids of the papers whose metadata match every filter, e.g. filter(key='SIGIR2021', session='...').
+        """
+        mask = np.ones(len(self.titles), dtype=bool)
+        for field, value in filters.items():
+            mask &= self.metadata[field] == value
+        return np.flatnonzero(mask)
+
+    def search(self, query, k=None, **filters):
+        """
+        Ranks the papers matching the filters by the cosine similarity of their title with the query.
+        Args:
+            query(numpy.ndarray): The normalized query vector.
+            k(int): The maximum number of results. None means all the matching papers.
+            filters: Metadata values the papers must have (key, conference, year or session).
+        Returns:
+            A list of (title, similarity) tuples, best first.
+        """
+        ids = self.filter(**filters)
+        if len(ids) == 0:
+            return []
+        similarities = self.vectors[ids] @ query
+        order = np.argsort(-similarities)[:k]
+        return [(self.titles[ids[i]], float(similarities[i])) for i in order]
@@ -1,19 +1,30 @@
 import json
+import logging
 import regex as re
 import numpy as np
 import pickle
 import os
 import requests
+import threading
+import time
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
+from ..input_handler.deadline import DeadlineExceeded
+from ..input_handler.turn_context import current_turn
+from ..retriever.author_store import AuthorProfileStore
+from ..retriever.arxiv_index import MODEL_NAME, arxiv_index_path, build_arxiv_index
 from ..retriever.dense_retriever import DenseRetriever
+from ..retriever.semantic_scholar import SemanticScholarClient, SemanticScholarError
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
 class PaperRetrieval():
     def __init__(self, params):
         self.params = params
 
-        self.api_url = 'https://api.semanticscholar.org/graph/v1'
+        self.api = SemanticScholarClient.from_params(self.params)
 
         #self.connection_string = self.params['connection string']
         self.client = MongoClient('mongodb://localhost:27017')
@@ -23,108 +34,267 @@ class PaperRetrieval():
 
         #self.collection_name = self.params['collection name']
         self.col = self.db['arXiv']
+        # get_papers() looks papers up by their row in the dense index; the index is created on the first lookup, so
+        # that the client stays lazy and a missing Mongo server only disables paper questions
+        self.col_indexed = False
 
-        self.arxiv_path = self.params['arxiv path']
+        self.arxiv_path = self.params.get('arxiv path')
 
-        #self.model = SentenceTransformer('multi-qa-mpnet-base-dot-v1', device='cuda')
+        # the offline author profiles built from the arXiv dump (see core.retriever.author_store), if available
+        self.author_store = None
+        if 'author store path' in self.params and os.path.exists(self.params['author store path']):
+            self.author_store = AuthorProfileStore(self.params['author store path'])
 
-        #self.dense_index = DenseRetriever(self.model)
-        #if os.path.exists('{}/arxiv_index.pkl'.format(self.params['index path'])):
-        #    print('true') #testing purposes
-        #    self.dense_index.load_index('{}/arxiv_index.pkl'.format(self.params['index path']))
-        #else:
-        #    print('false') #testing purpoes
-        #    self.index_docs()
+        # last known profiles, served when Semantic Scholar cannot answer within the request deadline
+        self.profiles = OrderedDict()
+        self.max_profiles = self.params.get('profile cache size', 10000)
+        self.profiles_lock = threading.Lock()
+
+        # the author records matching a name (with their papers), fetched ahead of time while the user is asked for
+        # one of the author's paper titles
+        self.candidates = OrderedDict()  # lowercased name -> (created, author records)
+        self.pending_candidates = {}  # lowercased name -> Future
+        self.candidates_ttl = self.params.get('profile ttl', 24 * 3600)
+        self.candidates_lock = threading.Lock()
+        self.prefetcher = ThreadPoolExecutor(max_workers=self.params.get('prefetch workers', 2))
+
+        # recently returned arXiv papers, by their row in the dense index
+        self.papers = OrderedDict()
+        self.max_papers = self.params.get('paper cache size', 10000)
+        self.paper_lock = threading.Lock()
+
+        # paper questions need the dense index of the arXiv dump, built offline with
+        # python -m core.retriever.arxiv_index <arxiv path> <index path>; without it they are disabled
+        self.model_name = MODEL_NAME
+        self.model = None
+        self.dense_index = None
+        if os.path.exists(arxiv_index_path(self.params['index path'])):
+            self.model = SentenceTransformer(self.model_name, device=self.params.get('paper model device'))
+            self.dense_index = DenseRetriever(self.model)
+            self.dense_index.load_index(arxiv_index_path(self.params['index path']))
+        else:
+            logging.warning('There is no arXiv index in {}, paper questions are disabled'.format(
+                self.params['index path']))
 
     def index_docs(self):
-        title_abstract = []
-        f = open(self.arxiv_path)
-        data = json.load(f)
-        print('here')
-        for key in data.keys():
-            title_abstract.append(data[key]['title'] + ' ' + data[key]['abstract'])
-        print('here')
-        self.dense_index.create_index_from_documents(title_abstract)
-        print('here')
-        self.dense_index.save_index(index_path='{}/arxiv_index.pkl'.format(self.params['index path']), vectors_path='{}/arxiv_vectors.pkl'.format(self.params['index path']))
-        f.close()
+        """
+        Builds the dense index of the arXiv dump (see core.retriever.arxiv_index). The progress shows an ETA if the
+        number of records of the dump is given as params['arxiv records'].
+        """
+        if self.arxiv_path is None:
+            raise Exception('The arXiv dump is not configured (params[\'arxiv path\'])!')
+        self.dense_index = build_arxiv_index(self.arxiv_path, self.params['index path'], model=self.model,
+                                             batch_size=self.params.get('embedding batch size', 256),
+                                             workers=self.params.get('embedding workers'),
+                                             records=self.params.get('arxiv records'))
+        self.model = self.dense_index.model
     
-    #returns best papers related to query in arXiv dataset, LOTS OF CODE DUPLICATION!!
+    def rank_papers(self, conv_list, k=10):
+        """
+        Returns:
+            The k arXiv papers closest to the user message, best first, as dicts with their 'index' in the dense index,
+            'id', 'title', 'authors' and 'abstract'. Without an arXiv index, a str explaining that paper search is
+            unavailable.
+        """
+        if self.dense_index is None:
+            return 'paper search unavailable'
+        vector = current_turn().embedding(self.model_name, self.dense_index.model, conv_list[0].text)
+        ids = [int(i) for i, _ in self.dense_index.search_by_vectors([vector], limit=k)[0] if i >= 0]
+        papers = self.get_papers(ids)
+        return [papers[i] for i in ids if i in papers]
+
+    def get_papers(self, ids):
+        """
+        Returns:
+            The arXiv papers with the given rows in the dense index, by row. Papers not returned recently are read
+            with a single query.
+        """
+        papers = {}
+        with self.paper_lock:
+            for i in ids:
+                if i in self.papers:
+                    self.papers.move_to_end(i)
+                    papers[i] = self.papers[i]
+        missing = [i for i in ids if i not in papers]
+        if len(missing) == 0:
+            return papers
+        if not self.col_indexed:
+            try:
+                self.col.create_index('index')
+                self.col_indexed = True
+            except PyMongoError:
+                logging.warning('Could not index the arXiv collection by dense index row', exc_info=True)
+        fetched = {paper['index']: paper for paper in self.col.find(
+            {'index': {'$in': missing}}, {'_id': 0, 'index': 1, 'id': 1, 'title': 1, 'authors': 1, 'abstract': 1})}
+        with self.paper_lock:
+            for i, paper in fetched.items():
+                self.papers[i] = paper
+                self.papers.move_to_end(i)
+            while len(self.papers) > self.max_papers:
+                self.papers.popitem(last=False)
+        return {**papers, **fetched}
+
     def paper_search(self, conv_list):
-        results = self.dense_index.search([conv_list[0].text])[0]
-        results = [i[1] for i in results][0]
-        title = self.col.find_one({'index': results})
-        return title
+        """
+        Returns:
+            The arXiv paper closest to the user message, or None.
+        """
+        ranked = self.rank_papers(conv_list, k=1)
+        return ranked[0] if isinstance(ranked, list) and len(ranked) > 0 else None
 
     def get_paper_id(self, author, title):
-        data = None
-        url = '{}/{}/{}'.format(self.api_url, 'author', 'search?query=')
-        author = author.replace(' ', '+')
-        url += '{}/{}'.format(author, '&fields=name,papers.title')
-        result = requests.get(url, timeout=10)
-        print(result)
-        if result.status_code == 200:
-            data = result.json()
-            if len(data) == 1 and 'error' in data:
-                data = {}
-        elif result.status_code == 403:
-            return 'HTTP status 403 Forbidden'
-        elif result.status_code == 429:
-            return 'HTTP status 429 Too Many Requests'
-        for entry in data['data']:
+        for entry in self.api.search_authors(author, 'name,papers.title'):
             for paper in entry['papers']:
                 if paper['title'] == title:
                     return paper['paperId']
         return None
     
     def get_author_id(self, author, paper_id):
-        data = None
-        url = '{}/{}/{}'.format(self.api_url, 'paper', paper_id)
-        url += '?fields=authors'
-        result = requests.get(url, timeout=10)
-        if result.status_code == 200:
-            data = result.json()
-            if len(data) == 1 and 'error' in data:
-                data = {}
-        elif result.status_code == 403:
-            return 'HTTP status 403 Forbidden'
-        elif result.status_code == 429:
-            return 'HTTP status 429 Too Many Requests'
-        for entry in data['authors']:
+        for entry in self.api.paper(paper_id, 'authors')['authors']:
             if entry['name'] == author:
-                print(entry['authorId'])
                 return entry['authorId']
+        return None
 
-    def user_profile(self, author, title):
-        data = None
+    def fetch_candidates(self, author):
+        candidates = self.api.search_authors(author, 'name,papers.title,papers.fieldsOfStudy')
+        with self.candidates_lock:
+            self.candidates[author.lower()] = (time.time(), candidates)
+            self.candidates.move_to_end(author.lower())
+            if len(self.candidates) > self.max_profiles:
+                self.candidates.popitem(last=False)
+        return candidates
+
+    def prefetch_author(self, author):
+        """
+        Starts fetching the author records matching a name in the background, unless they are already known or the
+        offline store has papers of an author with that name (if the title then turns out not to be one of them, the
+        records are fetched when needed).
+        """
+        if self.author_store is not None and self.author_store.has_author(author):
+            return
+        key = author.lower()
+        with self.candidates_lock:
+            fresh = key in self.candidates and time.time() - self.candidates[key][0] <= self.candidates_ttl
+            if fresh or key in self.pending_candidates:
+                return
+            future = self.prefetcher.submit(self.fetch_candidates, author)
+            self.pending_candidates[key] = future
+
+        def done(future):
+            with self.candidates_lock:
+                if self.pending_candidates.get(key) is future:
+                    del self.pending_candidates[key]
+
+        future.add_done_callback(done)
+
+    def author_candidates(self, author):
+        """
+        Returns:
+            The author records matching a name, prefetched or fetched now.
+        """
+        key = author.lower()
+        with self.candidates_lock:
+            if key in self.candidates and time.time() - self.candidates[key][0] <= self.candidates_ttl:
+                self.candidates.move_to_end(key)
+                return self.candidates[key][1]
+            future = self.pending_candidates.get(key)
+        if future is not None:
+            try:
+                return future.result(timeout=current_turn().deadline.timeout(10))
+            except Exception:
+                # the background fetch failed or is still running when the deadline is close, so fetch now (which
+                # raises DeadlineExceeded if there is no time left)
+                pass
+        return self.fetch_candidates(author)
+
+    def find_author(self, author, title):
+        """
+        Searches authors by name, and returns the one who wrote the paper with the given title together with their
+        papers. A single request replaces the paper id -> author id -> author papers round trips, and is usually
+        prefetched while the user was typing the title (see prefetch_author()).
+        """
+        for entry in self.author_candidates(author):
+            for paper in entry['papers']:
+                if paper['title'] is not None and paper['title'].strip().lower() == title.strip().lower():
+                    return entry
+        return None
+
+    def resolve_author(self, author, titles):
+        """
+        Identifies an author by any of the given titles of their papers (e.g. those of the conference program), or as
+        the only author with that name.
+        Returns:
+            An (author id, list of work titles) tuple, as author_profile().
+        """
+        if self.author_store is not None:
+            author_key, papers = self.author_store.profile(author, titles)
+            works = self.arxiv_works(papers)
+            if len(works) > 0:
+                return 'arxiv:' + author_key, works
+        titles = {title.strip().lower() for title in titles}
+        candidates = self.author_candidates(author)
+        for entry in candidates:
+            if any(paper['title'] is not None and paper['title'].strip().lower() in titles
+                   for paper in entry['papers']):
+                return entry['authorId'], self.author_works(entry['papers'])
+        if len(candidates) == 1:
+            return candidates[0]['authorId'], self.author_works(candidates[0]['papers'])
+        return None, []
+
+    @staticmethod
+    def author_works(papers):
         author_works = []
-        paper_id = self.get_paper_id(author, title)
-        auth_id = self.get_author_id(author, paper_id)
-
-        url = '{}/{}/{}'.format(self.api_url, 'author', auth_id)
-        url += '?fields=papers.title,papers.fieldsOfStudy,papers.abstract'
-        result = requests.get(url, timeout=10)
-        if result.status_code == 200:
-            data = result.json()
-            if len(data) == 1 and 'error' in data:
-                data = {}
-        elif result.status_code == 403:
-            return 'HTTP status 403 Forbidden'
-        elif result.status_code == 429:
-            return 'HTTP status 429 Too Many Requests'
-        for entry in data['papers']:
-            if entry['fieldsOfStudy'] is not None and 'Computer Science' in entry['fieldsOfStudy']:
-                big_str = ''
+        for entry in papers:
+            if entry.get('fieldsOfStudy') is not None and 'Computer Science' in entry['fieldsOfStudy']:
                 if entry['title'] is not None:
-                    big_str = entry['title']
-                    #if entry['abstract'] is not None:
-                    #    big_str = big_str + ' ' + entry['abstract']
-                    author_works.append(big_str)
+                    author_works.append(entry['title'])
         return author_works
+
+    @staticmethod
+    def arxiv_works(papers):
+        return [paper['title'] for paper in papers if any(c.startswith('cs.') for c in paper['categories'].split())]
+
+    def author_profile(self, author, title):
+        """
+        Returns the works of an author, identified as the one who wrote the paper with the given title.
+        Returns:
+            An (author id, list of work titles) tuple. The id is the Semantic Scholar author id, or the author key of
+            the offline store for profiles found there. It is None when the author is not found.
+        """
+        if self.author_store is not None:
+            author_key, papers = self.author_store.profile(author, [title])
+            works = self.arxiv_works(papers)
+            if len(works) > 0:
+                return 'arxiv:' + author_key, works
+        key = (author.lower(), title.strip().lower())
+        try:
+            entry = self.find_author(author, title)
+        except (requests.exceptions.Timeout, DeadlineExceeded):
+            current_turn().degrade('user profile')
+            return self.last_profile(key)
+        except SemanticScholarError:
+            logging.exception('Could not get the profile of {}'.format(author))
+            return self.last_profile(key)
+        if entry is None:
+            return None, []
+        profile = (entry['authorId'], self.author_works(entry['papers']))
+        with self.profiles_lock:
+            self.profiles[key] = profile
+            self.profiles.move_to_end(key)
+            if len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+        return profile
+
+    def last_profile(self, key):
+        with self.profiles_lock:
+            return self.profiles.get(key, (None, []))
+
+    def user_profile(self, author, title):
+        return self.author_profile(author, title)[1]
     
     def get_results(self, conv_list, index):
         if index in range(11,13):
-            return self.paper_search(conv_list)
+            return self.rank_papers(conv_list, self.params.get('paper results', 10))
         if index in range(13,15):
             return self.user_profile(self.params['DA list'][0]['authors'][0], conv_list[0].text)
 
@@ -0,0 +1,127 @@
+"""
+A background job precomputing the profiles of every author of the loaded conferences.
+"""
+
+import logging
+import threading
+import time
+
+
+def conference_author_titles(data):
+    """
+    Returns:
+        A dict from each author of the conference data (see ConferenceRetrieval.get_data()) to the titles of their
+        papers in the program. Workshop and tutorial organizers without a paper get an empty list.
+    """
+    titles = {}
+    for conference in data.values():
+        for entity, entries in conference.items():
+            for entry in entries:
+                if entity == 'session':
+                    for title, authors in zip(entry.get('paper titles', []), entry.get('authors', [])):
+                        for author in authors:
+                            titles.setdefault(author, []).append(title)
+                else:
+                    for author in entry.get('authors', []):
+                        titles.setdefault(author, [])
+    return titles
+
+
+class ProfilePrecomputeJob:
+    def __init__(self, conference_retrieval, paper_retrieval, rate=0.2, interval=12 * 3600):
+        """
+        Walks all the authors of the loaded conferences every interval seconds. Each author is resolved to their
+        Semantic Scholar record, using their paper titles in the program to pick among authors with the same name,
+        and their profile vector is computed. Both end up in the caches used by live requests, so that profile
+        questions about conference authors do not wait for Semantic Scholar. Authors refreshed less than interval
+        seconds ago are skipped.
+        Args:
+            conference_retrieval(ConferenceRetrieval): Holds the conference data and the profile vector cache.
+            paper_retrieval(PaperRetrieval): Resolves the authors.
+            rate(float): The maximum number of authors resolved per second through Semantic Scholar, which leaves
+                the rest of its rate limit to live requests. Authors resolved without a request (by the offline author
+                store or a cached response) are not paced.
+            interval(float): The time in seconds between two walks.
+        """
+        self.CR = conference_retrieval
+        self.PR = paper_retrieval
+        self.rate = rate
+        self.interval = interval
+        self.refreshed = {}  # author -> time of the last successful resolution
+        self.progress = {'authors': 0, 'done': 0, 'resolved': 0, 'unresolved': 0, 'failed': 0, 'started': None,
+                         'finished': None}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            self.run_once()
+            self.stopped.wait(self.interval)
+
+    def run_once(self):
+        authors = conference_author_titles(self.CR.data)
+        if len(authors) > self.CR.profile_vectors.max_entries:
+            logging.warning('{} conference authors do not fit in the profile cache ({} entries)'.format(
+                len(authors), self.CR.profile_vectors.max_entries))
+        with self.lock:
+            self.progress = {'authors': len(authors), 'done': 0, 'resolved': 0, 'unresolved': 0, 'failed': 0,
+                             'started': time.time(), 'finished': None}
+        for author, titles in authors.items():
+            if self.stopped.is_set():
+                return
+            start = time.monotonic()
+            sent = self.PR.api.requests_sent()
+            outcome = None
+            if time.time() - self.refreshed.get(author, 0) >= self.interval:
+                outcome = self.precompute(author, titles)
+            with self.lock:
+                self.progress['done'] += 1
+                if outcome is not None:
+                    self.progress[outcome] += 1
+            if self.PR.api.requests_sent() > sent:
+                self.stopped.wait(max(0.0, 1 / self.rate - (time.monotonic() - start)))
+        with self.lock:
+            self.progress['finished'] = time.time()
+        logging.info('Precomputed author profiles: {}'.format(self.stats()))
+
+    def precompute(self, author, titles):
+        """
+        Returns:
+            'resolved', 'unresolved' or 'failed'.
+        """
+        try:
+            author_id, works = self.PR.resolve_author(author, titles)
+            if author_id is None:
+                return 'unresolved'
+            self.CR.profile_vectors.vector(author_id, works)
+        except Exception:
+            logging.exception('Could not precompute the profile of {}'.format(author))
+            return 'failed'
+        with self.lock:
+            self.refreshed[author] = time.time()
+        return 'resolved'
+
+    def stats(self):
+        """
+        Returns:
+            The progress of the current (or last) walk, and the freshness of the precomputed profiles: how many are
+            younger than the interval, and the age in seconds of the oldest one.
+        """
+        with self.lock:
+            now = time.time()
+            ages = [now - refreshed for refreshed in self.refreshed.values()]
+            return {**self.progress,
+                    'fresh': sum(1 for age in ages if age < self.interval),
+                    'oldest age': max(ages) if len(ages) > 0 else None}
@@ -0,0 +1,72 @@
+"""
+Cached author profile embeddings, used as query vectors for profile-based recommendations.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from collections import OrderedDict
+
+
+class ProfileVectorCache:
+    def __init__(self, model, ttl=24 * 3600, max_entries=10000):
+        """
+        Encodes the profile of an author (the titles of their works) into a single vector: the normalized mean of the
+        normalized title embeddings. Vectors are kept by author id for ttl seconds, and the least recently used ones
+        are evicted once there are more than max_entries of them.
+        Args:
+            model(SentenceTransformer): The model the titles are encoded with. It must be the model of the vectors the
+                profiles are compared with.
+            ttl(float): The lifetime of a profile vector in seconds.
+            max_entries(int): The maximum number of profile vectors kept.
+        """
+        self.model = model
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.vectors = OrderedDict()  # author id -> (created, vector)
+        self.counts = {'hit': 0, 'miss': 0}
+        self.lock = threading.Lock()
+
+    def get(self, author_id):
+        """
+        Returns:
+            The cached profile vector of the author, or None.
+        """
+        with self.lock:
+            entry = self.vectors.get(author_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self.counts['miss'] += 1
+                return None
+            self.vectors.move_to_end(author_id)
+            self.counts['hit'] += 1
+            return entry[1]
+
+    def put(self, author_id, vector):
+        with self.lock:
+            self.vectors[author_id] = (time.time(), vector)
+            self.vectors.move_to_end(author_id)
+            while len(self.vectors) > self.max_entries:
+                self.vectors.popitem(last=False)
+
+    def encode(self, works):
+        vectors = np.asarray(self.model.encode(works, batch_size=32), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        vector = vectors.mean(axis=0)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def vector(self, author_id, works):
+        """
+        Returns:
+            The profile vector of the author, encoded from works unless it is cached, or None if works is empty.
+        """
+        vector = self.get(author_id)
+        if vector is None and len(works) > 0:
+            vector = self.encode(works)
+            self.put(author_id, vector)
+        return vector
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, 'size': len(self.vectors)}
@@ -0,0 +1,243 @@
+"""
+A Semantic Scholar Graph API client with connection pooling, rate limiting, retries and an on-disk response cache.
+"""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from ..input_handler.deadline import DeadlineExceeded
+from ..input_handler.turn_context import current_turn
+
+
+class SemanticScholarError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        Allows rate requests per second on average, and bursts of up to burst requests.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token.
+        Returns:
+            The number of seconds to wait before the token may be used.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def release(self):
+        """
+        Gives back a token reserved by a request that was abandoned before being sent.
+        """
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class ResponseStore:
+    def __init__(self, path, ttl):
+        """
+        Keeps API responses in a local SQLite file for ttl seconds.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, body TEXT)')
+        self.db.commit()
+
+    def reopen(self):
+        """
+        Opens a new connection in a forked process, dropping the one inherited from the parent without using it.
+        """
+        with self.lock:
+            self.open()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT created, body FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return json.loads(row[1])
+
+    def put(self, key, data):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (key, time.time(), json.dumps(data)))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SemanticScholarClient:
+    def __init__(self, base_url='https://api.semanticscholar.org/graph/v1', api_key=None, rate=1.0, burst=5,
+                 max_retries=4, backoff=0.5, timeout=10, cache_path=None, cache_ttl=7 * 24 * 3600, pool_size=16):
+        """
+        All requests share one keep-alive connection pool, and go through a token bucket so that the API rate limit
+        is not hit. Requests answered with 429 or a server error are retried with exponential backoff, waiting as
+        long as the Retry-After header asks. Successful responses are cached on disk by URL and parameters (fields
+        included).
+        Every wait and timeout is capped by the deadline of the current turn.
+        Args:
+            base_url(str): The API root, which tests can point to a local server.
+            api_key(str): The Semantic Scholar API key, or None.
+            rate(float): The average number of requests per second.
+            burst(int): The maximum number of requests sent at once.
+            max_retries(int): The number of retries of a failed request.
+            backoff(float): The delay of the first retry in seconds, doubled for each next one.
+            timeout(float): The timeout of a request in seconds.
+            cache_path(str): The SQLite file of the response cache, or None for no cache.
+            cache_ttl(float): The lifetime of a cached response in seconds.
+            pool_size(int): The maximum number of pooled connections.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.bucket = TokenBucket(rate, burst)
+        self.local = threading.local()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = ResponseStore(cache_path, cache_ttl) if cache_path is not None else None
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.session = self.open_session()
+
+    def open_session(self):
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+        if self.api_key is not None:
+            session.headers['x-api-key'] = self.api_key
+        return session
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(base_url=params.get('semantic scholar url', 'https://api.semanticscholar.org/graph/v1'),
+                   api_key=params.get('semantic scholar key'),
+                   rate=params.get('semantic scholar rate', 1.0),
+                   cache_path=params.get('semantic scholar cache'),
+                   cache_ttl=params.get('semantic scholar cache ttl', 7 * 24 * 3600))
+
+    def get(self, path, **query):
+        """
+        Sends a GET request to the API.
+        Args:
+            path(str): The endpoint path, e.g. 'author/search'.
+            query: The query parameters, e.g. query='Hamed Zamani', fields='name,papers.title'.
+        Returns:
+            The decoded JSON response.
+        Raises:
+            SemanticScholarError: If the API answers with an error or an invalid body, or still fails after max_retries
+            retries.
+            DeadlineExceeded: If the deadline of the turn expires while waiting.
+            requests.exceptions.Timeout: If the API does not answer in time.
+        """
+        url = '{}/{}'.format(self.base_url, path.lstrip('/'))
+        key = json.dumps([url, sorted(query.items())])
+        if self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+
+        deadline = current_turn().deadline
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.wait(self.bucket.reserve(), deadline)
+            except DeadlineExceeded:
+                self.bucket.release()
+                raise
+            try:
+                self.local.sent = self.requests_sent() + 1
+                response = self.session.get(url, params=query, timeout=deadline.timeout(self.timeout))
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.max_retries:
+                    raise SemanticScholarError('Could not get a response from {}.'.format(self.base_url))
+                self.wait(self.retry_delay(attempt), deadline)
+                continue
+            if response.status_code == 200:
+                try:
+                    data = response.json()
+                except ValueError:
+                    raise SemanticScholarError('Invalid JSON response for {}'.format(url), response.status_code)
+                if self.cache is not None:
+                    self.cache.put(key, data)
+                return data
+            if response.status_code != 429 and response.status_code < 500:
+                raise SemanticScholarError('HTTP status {} for {}'.format(response.status_code, url),
+                                           response.status_code)
+            if attempt == self.max_retries:
+                raise SemanticScholarError('HTTP status {} for {} after {} retries'.format(
+                    response.status_code, url, self.max_retries), response.status_code)
+            logging.info('HTTP status {} for {}, retrying'.format(response.status_code, url))
+            self.wait(self.retry_delay(attempt, response.headers.get('Retry-After')), deadline)
+
+    def requests_sent(self):
+        """
+        Returns:
+            The number of HTTP requests sent so far by the calling thread (cache hits are not requests).
+        """
+        return getattr(self.local, 'sent', 0)
+
+    def retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # the jitter keeps concurrent requests from retrying in lockstep
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    def wait(self, seconds, deadline):
+        if seconds <= 0:
+            return
+        if not deadline.allows(seconds):
+            raise DeadlineExceeded('The request deadline does not allow to wait {:.1f} seconds.'.format(seconds))
+        time.sleep(seconds)
+
+    def search_authors(self, name, fields):
+        """
+        Returns:
+            The list of authors matching the name, with the given fields.
+        """
+        return self.get('author/search', query=name, fields=fields).get('data', [])
+
+    def paper(self, paper_id, fields):
+        return self.get('paper/{}'.format(paper_id), fields=fields)
+
+    def reopen(self):
+        """
+        Opens a new connection pool and cache connection in a forked process. The connections inherited from the
+        parent are dropped without being used, since their sockets are shared with it.
+        """
+        self.session = self.open_session()
+        if self.cache is not None:
+            self.cache.reopen()
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -8,6 +8,7 @@ from nltk import WordNetLemmatizer, pos_tag
 from nltk.corpus import wordnet, stopwords
 from typing import List
 from tqdm import tqdm
+from ..input_handler.turn_context import current_turn
 
 lemmatizer = WordNetLemmatizer()
 stopwords = set(stopwords.words('english'))
@@ -181,7 +182,7 @@ class SparseRetriever:
         :param query:
         :return:
         """
-        query = tokenize(query)
+        query = current_turn().get('tokens', query, lambda: tokenize(query))
         scores = {}
         for q in query:
             hashed_word = string_hash(q) % self.ngram_buckets
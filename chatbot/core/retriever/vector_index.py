@@ -14,10 +14,13 @@ class VectorIndex:
     def add(self, v):
         self.vectors.append(v)
 
-    def build(self, use_gpu=False):
-        self.vectors = np.array(self.vectors)
-
-        faiss.normalize_L2(self.vectors)
+    def build(self, use_gpu=False, chunk_size=100000):
+        """
+        Builds the index. The vectors may be a memory map (see core.retriever.embedding_pipeline): they are then
+        normalized and added chunk_size rows at a time, so they are never all copied into memory.
+        """
+        if not isinstance(self.vectors, np.ndarray):
+            self.vectors = np.array(self.vectors, dtype=np.float32)
 
         logging.info('Indexing {} vectors'.format(self.vectors.shape[0]))
 
@@ -38,7 +41,10 @@ class VectorIndex:
 
             logging.info('Training index...')
 
-            self.index.train(self.vectors)
+            # faiss trains on at most 256 vectors per centroid anyway
+            sample = min(self.vectors.shape[0], 256 * num_centroids)
+            rows = np.sort(np.random.default_rng(0).choice(self.vectors.shape[0], sample, replace=False))
+            self.index.train(self.normalized(self.vectors[rows]))
         else:
             self.index = faiss.IndexFlatL2(self.d)
             if faiss.get_num_gpus() > 0 and use_gpu:
@@ -46,7 +52,14 @@ class VectorIndex:
 
         logging.info('Adding vectors to index...')
 
-        self.index.add(self.vectors)
+        for start in range(0, self.vectors.shape[0], chunk_size):
+            self.index.add(self.normalized(self.vectors[start:start + chunk_size]))
+
+    @staticmethod
+    def normalized(vectors):
+        vectors = np.array(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
 
     def load(self, path):
         self.index = faiss.read_index(path)
@@ -3,42 +3,127 @@ The FileIO interface (for experimental batch interactions).
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+import io
+import itertools
+import json
+import multiprocessing
+import os
 import time
 
+from collections import deque
+
 from interface.interface import Interface
 from core.interaction_handler.msg import Message
 
+# the interface whose process_chunk() is run by the worker processes, which inherit it (and the loaded models) on fork.
+_interface = None
+
+
+def _init_worker():
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def _process_chunk(lines):
+    return _interface.process_chunk(lines)
+
 
 class FileioInterface(Interface):
     def __init__(self, params):
         super().__init__(params)
         self.msg_id = int(time.time())
+        self.batch_size = self.params['batch_size'] if 'batch_size' in self.params else 512
+
+    def parse_line(self, line):
+        str_list = line.strip().split('\t')
+        if len(str_list) < 2:
+            raise Exception('Each input line should contain at least 2 elements: a query ID and a query text.')
+        qid = str_list[0]
+
+        conv_list = []
+        for i in range(1, len(str_list)):
+            user_info = {'first_name': 'NONE'}
+            msg_info = {'msg_id': qid,
+                        'msg_type': 'text',
+                        'msg_source': 'user'}
+            msg = Message(user_interface='NONE',
+                          user_id=qid,
+                          user_info=user_info,
+                          msg_info=msg_info,
+                          text=str_list[i],
+                          timestamp=-1)
+            conv_list.append(msg)
+        conv_list.reverse()
+        return qid, conv_list
+
+    def process_chunk(self, lines):
+        """
+        Answers a chunk of input lines.
+        Returns:
+            The number of lines, the qid of the last one, and the output text of the chunk.
+        """
+        convs = [self.parse_line(line) for line in lines]
+        if 'experimental_batch_request_handler' in self.params:
+            # the whole chunk goes through each stage of the pipeline at once.
+            output_msgs = self.params['experimental_batch_request_handler']([conv_list for qid, conv_list in convs])
+        else:
+            # tagging the whole chunk at once is much faster than tagging one query at a time.
+            if 'ner prefetch' in self.params:
+                self.params['ner prefetch']([conv_list[0].text for qid, conv_list in convs])
+            output_msgs = [self.params['experimental_request_handler'](conv_list) for qid, conv_list in convs]
+        output = io.StringIO()
+        for (qid, conv_list), output_msg in zip(convs, output_msgs):
+            self.result_presentation(output_msg, {'output_file': output, 'qid': qid})
+        return len(lines), convs[-1][0], output.getvalue()
 
     def run(self):
-        output_file = open(self.params['output_file_path'], 'w+')
+        """
+        Answers every line of the input file. With params['workers'] > 1, chunks of lines are answered by worker
+        processes forked from this one, so they share the already loaded models. Outputs are written in input order.
+        After each chunk, the output is flushed and a checkpoint is saved next to it. With params['resume'], a crashed
+        run continues after the last completed qid.
+        """
+        output_path = self.params['output_file_path']
+        checkpoint_path = output_path + '.checkpoint'
+        checkpoint = {'lines': 0, 'offset': 0, 'qid': None}
+        if self.params.get('resume', False) and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            os.truncate(output_path, checkpoint['offset'])
+        output_file = open(output_path, 'a' if checkpoint['lines'] > 0 else 'w', buffering=1 << 20)
+
+        def write(result):
+            num_lines, qid, text = result
+            output_file.write(text)
+            output_file.flush()
+            checkpoint.update({'lines': checkpoint['lines'] + num_lines, 'offset': output_file.tell(), 'qid': qid})
+            with open(checkpoint_path + '.tmp', 'w') as f:
+                json.dump(checkpoint, f)
+            os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
         with open(self.params['input_file_path']) as input_file:
-            for line in input_file:
-                str_list = line.strip().split('\t')
-                if len(str_list) < 2:
-                    raise Exception('Each input line should contain at least 2 elements: a query ID and a query text.')
-                qid = str_list[0]
-
-                conv_list = []
-                for i in range(1, len(str_list)):
-                    user_info = {'first_name': 'NONE'}
-                    msg_info = {'msg_id': qid,
-                                'msg_type': 'text',
-                                'msg_source': 'user'}
-                    msg = Message(user_interface='NONE',
-                                  user_id=-1,
-                                  user_info=user_info,
-                                  msg_info=msg_info,
-                                  text=str_list[i],
-                                  timestamp=-1)
-                    conv_list.append(msg)
-                conv_list.reverse()
-                output_msg = self.params['experimental_request_handler'](conv_list)
-                self.result_presentation(output_msg, {'output_file': output_file, 'qid': qid})
+            for _ in itertools.islice(input_file, checkpoint['lines']):
+                pass
+            chunks = iter(lambda: list(itertools.islice(input_file, self.batch_size)), [])
+            workers = self.params.get('workers', 1)
+            if workers > 1:
+                global _interface
+                _interface = self
+                with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+                    # a bounded number of chunks is in flight, so the input is streamed rather than read at once.
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(pool.apply_async(_process_chunk, (chunk,)))
+                        if len(pending) >= 2 * workers:
+                            write(pending.popleft().get())
+                    while len(pending) > 0:
+                        write(pending.popleft().get())
+            else:
+                for chunk in chunks:
+                    write(self.process_chunk(chunk))
         output_file.close()
 
     def result_presentation(self, output_msg, params):
@@ -57,4 +142,4 @@ class FileioInterface(Interface):
             else:
                 raise Exception('text output format is only recognized for text outputs.')
         else:
-            raise Exception('Unknown output file format!')
\ No newline at end of file
+            raise Exception('Unknown output file format!')
@@ -27,26 +27,53 @@ class ConvQA(CIS):
         self.request_dispatcher = DialogManager(self.params)
         self.output_selection = SimpleOutputSelection(self.params)
 
-    def request_handler_func(self, conv_list):
+    def request_handler_func(self, conv_list, deadline=None):
         """
         This function is called for each conversational interaction made by the user. In fact, this function calls the
         dispatcher to send the user request to the information seeking components.
         Args:
             conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
             user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            deadline(core.input_handler.deadline.Deadline): The deadline of the request, if any.
         Returns:
             output_msg(Message): Returns an output message that should be sent to the UI to be presented to the user.
+            If some stages degraded to meet the deadline, they are listed in output_msg.msg_info['partial'].
         """
         self.logger.info(conv_list)
-        dispatcher_output = self.request_dispatcher.dispatch(conv_list)
-        output_msg = self.output_selection.get_output(conv_list, dispatcher_output)
+        with self.request_dispatcher.session(conv_list):
+            dispatcher_output = self.request_dispatcher.dispatch(conv_list, deadline)
+            output_msg = self.output_selection.get_output(conv_list, dispatcher_output)
+        if 'partial' in dispatcher_output:
+            output_msg.msg_info['partial'] = dispatcher_output['partial']
         return output_msg
 
+    def batch_request_handler_func(self, conv_lists):
+        """
+        Handles many conversations at once, running each model-bound stage of the dispatcher once for the whole batch.
+        Args:
+            conv_lists(list): A list of conv_list, as given to request_handler_func.
+        Returns:
+            The list of output messages, in the order of conv_lists.
+        """
+        dispatcher_outputs = self.request_dispatcher.dispatch_batch(conv_lists)
+        output_msgs = []
+        for conv_list, dispatcher_output in zip(conv_lists, dispatcher_outputs):
+            with self.request_dispatcher.session(conv_list):
+                output_msgs.append(self.output_selection.get_output(conv_list, dispatcher_output))
+        return output_msgs
+
+    def close(self):
+        self.request_dispatcher.close()
+        super().close()
+
     def run(self):
         """
             This function is called to run the ConvQA system. In live mode, it never stops until the program is killed.
         """
-        self.interface.run()
+        try:
+            self.interface.run()
+        finally:
+            self.close()
 
 
 if __name__ == '__main__':
@@ -55,8 +82,10 @@ if __name__ == '__main__':
                     'logger': Logger({})}  # for logging into file, pass the filepath to the Logger class.
 
     # These are required database parameters if the mode is 'live'. The host and port of the machine hosting the
-    # database, as well as the database name.
-    db_params = {'interaction_db_host': 'localhost',
+    # database, as well as the database name. Single-box deployments can instead set 'interaction_db_backend' to
+    # 'sqlite' and 'interaction_db_path' to a local file.
+    db_params = {'interaction_db_backend': 'mongo',
+                 'interaction_db_host': 'localhost',
                  'interaction_db_port': 27017,
                  'interaction_db_name': 'macaw_test'}
 
@@ -65,10 +94,26 @@ if __name__ == '__main__':
 
     # These are parameters used by the retrieval model.
     retrieval_params = {'conf dataset': 'C:\\Users\\snipe\\Documents\\GitHub\\ERSP\\conference_data.json',
+                        # holds the arXiv index: python -m core.retriever.arxiv_index <arxiv path> <index path>
                         'index path': 'D:/ERSP/chatbot/input_handler',
                         'arxiv path': 'C:\\Users\\snipe\\Documents\\GitHub\\ERSP\\arxiv_parsed.json',
+                        # built from the arXiv dump with: python -m core.retriever.author_store <arxiv path> <store>
+                        'author store path': 'D:/ERSP/chatbot/input_handler/arxiv_authors.db',
                         'DA list': []}
 
-    params = {**basic_params, **db_params, **interface_params, **retrieval_params}
+    # These are parameters of the Semantic Scholar client. API responses are cached on disk for 'semantic scholar cache
+    # ttl' seconds, and requests are limited to 'semantic scholar rate' per second.
+    s2_params = {'semantic scholar url': 'https://api.semanticscholar.org/graph/v1',
+                 'semantic scholar cache': 'semantic_scholar_cache.db',
+                 'semantic scholar cache ttl': 7 * 24 * 3600,
+                 'semantic scholar rate': 1.0}
+
+    # These are parameters used by the NER model. 'ner model' can be 'large' or 'fast' (flair), or 'spacy'. Concurrent
+    # requests wait at most 'ner max wait' seconds to be tagged together in batches of up to 'ner batch size'.
+    ner_params = {'ner model': 'large',
+                  'ner batch size': 32,
+                  'ner max wait': 0.005}
+
+    params = {**basic_params, **db_params, **interface_params, **retrieval_params, **s2_params, **ner_params}
     basic_params['logger'].info(params)
     ConvQA(params).run()
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""
+Tests of the offline author profile store.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.retriever.author_store import AuthorProfileStore
+
+
+class AuthorProfileStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        records = [{'id': '1', 'title': 'Neural  ranking', 'abstract': None, 'categories': 'cs.IR',
+                    'authors': 'Wei Li, Bob Smith'},
+                   {'id': '2', 'title': 'Dense retrieval', 'abstract': 'x', 'categories': 'cs.IR',
+                    'authors': 'Wei Li, Bob Smith, Carl Jones'},
+                   {'id': '3', 'title': 'Query expansion', 'abstract': 'x', 'categories': 'cs.IR',
+                    'authors': 'Wei Li, Carl Jones'},
+                   {'id': '4', 'title': 'Galaxy clusters', 'abstract': 'x', 'categories': 'astro-ph',
+                    'authors': 'Wei Li, Dan Star'}]
+        path = os.path.join(self.directory.name, 'arxiv.jsonl')
+        with open(path, 'w') as f:
+            f.write('\n'.join(json.dumps(record) for record in records))
+        self.store = AuthorProfileStore(os.path.join(self.directory.name, 'authors.db'))
+        self.store.build(path)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_namesakes_are_told_apart(self):
+        key, papers = self.store.profile('Wei Li', ['Query expansion'])
+        self.assertEqual([paper['title'] for paper in papers], ['Neural ranking', 'Dense retrieval', 'Query expansion'])
+        other_key, papers = self.store.profile('Wei Li', ['Galaxy clusters'])
+        self.assertEqual([paper['title'] for paper in papers], ['Galaxy clusters'])
+        self.assertNotEqual(key, other_key)
+
+    def test_key_does_not_depend_on_the_titles(self):
+        keys = {self.store.profile('Wei Li', titles)[0]
+                for titles in (['Neural ranking'], ['Query expansion'], ['Dense retrieval', 'Query expansion'],
+                               ['Neural ranking', 'Dense retrieval', 'Galaxy clusters'])}
+        self.assertEqual(keys, {'wei li:1'})
+
+    def test_unknown_title(self):
+        self.assertEqual(self.store.profile('Wei Li', ['Unknown paper']), (None, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Tests of the dialog manager turn logic that do not need the retrieval models.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.input_handler.dialog_manager import DialogManager
+from core.input_handler.query_classification import QueryClassification
+from core.input_handler.result_cursor import ResultCursorStore
+from core.interaction_handler.dialogue_state import SessionDAList
+
+
+class AcceptancePagingTest(unittest.TestCase):
+    def setUp(self):
+        self.params = {'DA list': SessionDAList(20)}
+        self.QC = QueryClassification.__new__(QueryClassification)
+        self.QC.params = self.params
+        self.DM = DialogManager.__new__(DialogManager)
+        self.DM.params = self.params
+        self.DM.cursors = ResultCursorStore()
+        # the question is answered with the best of a ranked list, as for a session recommendation
+        self.DM.cached_conv_logic = lambda index, conv_list: self.DM.ranked_answer('conf rec', ['IR', 'NLP', 'RecSys'])
+
+    def turn(self, intent, index):
+        act = self.QC.dialogue_act({'intent': intent, 'intent index': index},
+                                   {'conference': 'SIGIR', 'year': '2022'}, ['session'] if intent == 'question' else [],
+                                   [])
+        self.params['DA list'].insert(0, act)
+        return self.DM.respond([])
+
+    def test_question_then_acceptances(self):
+        self.assertEqual(self.turn('question', 4), {'conf rec': 'IR'})
+        self.assertEqual(self.turn('acceptance', -1), {'conf rec': 'NLP'})
+        self.assertEqual(self.params['DA list'][0]['last similarity'], 1)
+        self.assertEqual(self.turn('acceptance', -1), {'conf rec': 'RecSys'})
+        self.assertEqual(self.params['DA list'][0]['last similarity'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests of the per-user dialogue state store.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.interaction_handler.dialogue_act import DialogueAct
+from core.interaction_handler.dialogue_state import DialogueStateStore, SessionDAList
+
+
+class DialogueStateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = DialogueStateStore(max_acts=100, max_sessions=2,
+                                        path=os.path.join(self.directory.name, 'state.db'))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_active_sessions_are_not_evicted(self):
+        session = self.store.get('a', pin=True)
+        for user_id in ('b', 'c', 'd'):
+            self.store.get(user_id)
+        self.assertIs(self.store.sessions.get('a'), session)
+        self.store.release(session)
+        self.store.get('e')
+        self.assertNotIn('a', self.store.sessions)
+
+    def test_session_is_not_evicted_before_it_is_entered(self):
+        class RacingStore(DialogueStateStore):
+            def get(self, user_id, pin=False):
+                session = super().get(user_id, pin)
+                # requests of other users arrive as soon as the store lock is released
+                if user_id == 'a':
+                    for other in ('b', 'c'):
+                        super().get(other)
+                return session
+
+        self.store.close()
+        self.store = RacingStore(max_acts=100, max_sessions=2, path=os.path.join(self.directory.name, 'race.db'))
+        acts = SessionDAList()
+        with self.store.session('a'):
+            acts.insert(0, DialogueAct('question', 0, None, [], []))
+        for other in ('d', 'e'):
+            self.store.get(other)
+        with self.store.session('a'):
+            self.assertEqual(len(acts), 1)
+
+    def test_concurrent_sessions_keep_their_acts(self):
+        acts = SessionDAList()
+        turns = 50
+
+        def converse(user_id):
+            for i in range(turns):
+                with self.store.session(user_id):
+                    acts.insert(0, DialogueAct('question', i, None, [], []))
+
+        threads = [threading.Thread(target=converse, args=('user {}'.format(i),)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            with self.store.session('user {}'.format(i)):
+                self.assertEqual(len(acts), turns)
+
+
+if __name__ == '__main__':
+    unittest.main()
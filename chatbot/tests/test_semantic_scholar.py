@@ -0,0 +1,143 @@
+"""
+Tests of the Semantic Scholar client against a stub API served on localhost.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.retriever.semantic_scholar import SemanticScholarClient, SemanticScholarError
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((time.monotonic(), self.path))
+        status, headers, body = self.server.replies.pop(0) if len(self.server.replies) > 0 else self.server.default
+        if status == 'truncated':
+            # announces a chunk longer than what is sent, then drops the connection
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'20\r\n{"data": ')
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        body = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SemanticScholarClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.replies = []
+        self.server.requests = []
+        self.server.default = (200, {}, json.dumps({'data': [{'authorId': '1', 'name': 'Hamed Zamani'}]}))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/graph/v1'.format(self.server.server_address[1])
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def client(self, **kwargs):
+        kwargs = {'rate': 100.0, 'burst': 100, 'backoff': 0.05, **kwargs}
+        client = SemanticScholarClient(base_url=self.url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_search_authors(self):
+        authors = self.client().search_authors('Hamed Zamani', 'name')
+        self.assertEqual(authors, [{'authorId': '1', 'name': 'Hamed Zamani'}])
+        self.assertTrue(self.server.requests[0][1].startswith('/graph/v1/author/search?'))
+
+    def test_retry_after_is_honored(self):
+        self.server.replies = [(429, {'Retry-After': '0.3'}, '{}')]
+        start = time.monotonic()
+        self.client().search_authors('Hamed Zamani', 'name')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertGreaterEqual(self.server.requests[1][0] - start, 0.3)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.replies = [(503, {}, '{}'), (500, {}, '{}')]
+        start = time.monotonic()
+        self.client().search_authors('Hamed Zamani', 'name')
+        self.assertEqual(len(self.server.requests), 3)
+        # the delays are backoff * 2 ** attempt, scaled by a jitter in [0.5, 1]
+        self.assertGreaterEqual(self.server.requests[2][0] - start, 0.05 * 0.5 + 0.1 * 0.5)
+
+    def test_retries_are_exhausted(self):
+        self.server.default = (502, {}, '{}')
+        with self.assertRaises(SemanticScholarError) as context:
+            self.client(max_retries=2).search_authors('Hamed Zamani', 'name')
+        self.assertEqual(context.exception.status_code, 502)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.replies = [(404, {}, '{}')]
+        with self.assertRaises(SemanticScholarError) as context:
+            self.client().paper('unknown', 'title')
+        self.assertEqual(context.exception.status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_invalid_json_raises(self):
+        self.server.replies = [(200, {}, '<html>')]
+        with self.assertRaises(SemanticScholarError):
+            self.client().search_authors('Hamed Zamani', 'name')
+
+    def test_truncated_body_is_retried(self):
+        self.server.replies = [('truncated', {}, '')]
+        authors = self.client().search_authors('Hamed Zamani', 'name')
+        self.assertEqual(len(authors), 1)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_token_bucket_paces_requests(self):
+        client = self.client(rate=10.0, burst=1)
+        start = time.monotonic()
+        for i in range(4):
+            client.search_authors('author {}'.format(i), 'name')
+        # the first request uses the burst, each next one waits for a token
+        self.assertGreaterEqual(time.monotonic() - start, 0.3 - 0.01)
+
+    def test_cache_hits(self):
+        path = os.path.join(self.directory.name, 's2.db')
+        client = self.client(cache_path=path)
+        first = client.search_authors('Hamed Zamani', 'name')
+        self.assertEqual(client.search_authors('Hamed Zamani', 'name'), first)
+        self.assertEqual(len(self.server.requests), 1)
+        # other fields are another request
+        client.search_authors('Hamed Zamani', 'name,papers.title')
+        self.assertEqual(len(self.server.requests), 2)
+        # the cache outlives the client
+        self.assertEqual(self.client(cache_path=path).search_authors('Hamed Zamani', 'name'), first)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_expired_cache_entries_are_refetched(self):
+        client = self.client(cache_path=os.path.join(self.directory.name, 's2.db'), cache_ttl=0)
+        client.search_authors('Hamed Zamani', 'name')
+        time.sleep(0.01)
+        client.search_authors('Hamed Zamani', 'name')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
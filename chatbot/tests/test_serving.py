@@ -0,0 +1,80 @@
+"""
+Tests of the admission control of the threaded HTTP server.
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import requests
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.input_handler.dialog_manager import DialogManager
+
+
+class ThreadedServingTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.running = threading.Semaphore(0)
+
+        def dispatch(conv_list, deadline=None):
+            self.running.release()
+            self.release.wait()
+            return {'answer': conv_list[0].text}
+
+        self.DM = DialogManager.__new__(DialogManager)
+        self.DM.app = Flask(__name__)
+        self.DM.params = {'serve threads': 1, 'max queue': 1, 'max queue latency': 5.0}
+        self.DM.dispatch = dispatch
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        threading.Thread(target=self.DM.serve, args=(self.port, 'threaded'), daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/encode'.format(self.port)
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+    def tearDown(self):
+        self.release.set()
+
+    def get(self, text, results):
+        results[text] = requests.get(self.url, params={'text': text}, timeout=10)
+
+    def test_full_queue_is_shed(self):
+        results = {}
+        # the first request holds the only processing slot, and the second one waits in the admission queue
+        first = threading.Thread(target=self.get, args=('first', results))
+        first.start()
+        self.assertTrue(self.running.acquire(timeout=5))
+        second = threading.Thread(target=self.get, args=('second', results))
+        second.start()
+        for _ in range(100):
+            if self.DM.admission.waiting == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.DM.admission.waiting, 1)
+
+        response = requests.get(self.url, params={'text': 'third'}, timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+        self.release.set()
+        first.join()
+        second.join()
+        self.assertEqual(results['first'].status_code, 200)
+        self.assertEqual(results['second'].status_code, 200)
+        self.assertEqual(self.DM.admission.shed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Compares the insert and history-read latency of the interaction database storage backends.
+
+    python prototypes/storage_benchmark.py --backends sqlite mongo --users 100 --turns 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'chatbot'))
+
+import util
+from core.interaction_handler.msg import Message
+from core.interaction_handler.storage import get_storage_backend
+
+
+def make_msg(user_id, turn):
+    return Message(user_interface='benchmark',
+                   user_id=user_id,
+                   user_info={'first_name': 'NONE'},
+                   msg_info={'msg_id': turn, 'msg_type': 'text', 'msg_source': 'user'},
+                   text='What are the sessions of ICML {} about graph neural networks?'.format(2000 + turn % 20),
+                   timestamp=util.current_time_in_milliseconds())
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return {'mean': statistics.mean(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]}
+
+
+def benchmark(backend, users, turns, batch_size):
+    """
+    Replays turns of many users: each turn reads the user's recent history, then writes the user and system messages,
+    in batches of batch_size messages as the write-behind queue of InteractionDB does.
+    Returns:
+        The insert latencies per message and the history read latencies, in milliseconds.
+    """
+    insert_latencies, read_latencies, batch = [], [], []
+    for turn in range(turns):
+        for user in range(users):
+            user_id = 'user{}'.format(user)
+            start = time.perf_counter()
+            backend.find_history(user_id, util.current_time_in_milliseconds() - 10 * 60 * 1000, 10)
+            read_latencies.append((time.perf_counter() - start) * 1000)
+            for msg in (make_msg(user_id, turn), make_msg(user_id, turn)):
+                batch.append({**msg.to_dict(), '_id': backend.new_id()})
+            if len(batch) >= batch_size:
+                start = time.perf_counter()
+                backend.insert_many(batch)
+                insert_latencies.append((time.perf_counter() - start) * 1000 / len(batch))
+                batch = []
+    return insert_latencies, read_latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', nargs='+', default=['sqlite', 'mongo'])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--turns', type=int, default=50)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--mongo_host', default='localhost')
+    parser.add_argument('--mongo_port', type=int, default=27017)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.backends:
+            backend = get_storage_backend({'interaction_db_backend': name,
+                                           'interaction_db_path': os.path.join(tmp_dir, 'macaw_benchmark.db'),
+                                           'interaction_db_host': args.mongo_host,
+                                           'interaction_db_port': args.mongo_port,
+                                           'interaction_db_name': 'macaw_benchmark_{}'.format(int(time.time()))})
+            insert_latencies, read_latencies = benchmark(backend, args.users, args.turns, args.batch_size)
+            if name == 'mongo':
+                backend.client.drop_database(backend.db.name)
+            backend.close()
+            for operation, latencies in (('insert', insert_latencies), ('history read', read_latencies)):
+                print('{:8} {:13} '.format(name, operation) +
+                      ' '.join('{} {:.3f} ms'.format(key, value) for key, value in percentiles(latencies).items()))